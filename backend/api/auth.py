@@ -71,9 +71,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return get_user_from_token(credentials.credentials)
+
+def get_user_from_token(token: str):
+    """Resolve a bearer token to its user, raising 401 like the REST dependency.
+    
+    Used directly where no Authorization header is available (e.g. WebSockets).
+    """
     try:
-        print(f"Received token: {credentials.credentials[:20]}...")  # Debug line
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        print(f"Received token: {token[:20]}...")  # Debug line
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         print(f"Decoded email: {email}")  # Debug line
         if email is None:
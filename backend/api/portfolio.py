@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File
 from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any, Optional
+import asyncio
 import json
 import os
 import csv
@@ -9,6 +10,11 @@ import uuid
 from datetime import datetime
 from pydantic import BaseModel
 from api.auth import get_current_user
+from core.portfolio_store import JournalWriteError, portfolio_store
+from core.lot_book import LOT_METHODS
+from core.stock_service import stock_service
+from core.valuation import value_portfolio
+from core.trade_import import TradeImportError, build_import, parse_trade_file
 
 router = APIRouter()
 
@@ -19,6 +25,7 @@ class TradeRequest(BaseModel):
     quantity: int
     price: float
     commission: Optional[float] = 0.0
+    lot_method: Optional[str] = 'FIFO'  # lot selection for sells: FIFO, LIFO or HIFO
 
 class Portfolio(BaseModel):
     cash: float
@@ -27,74 +34,71 @@ class Portfolio(BaseModel):
     created_at: str
     updated_at: str
 
-# Portfolio data storage
-PORTFOLIOS_FILE = "portfolios.json"
+# Portfolio data storage: snapshot (portfolios.json) plus append-only trade journal
+user_portfolios = portfolio_store.portfolios
 
-def load_portfolios():
-    """Load portfolios from file"""
-    try:
-        if os.path.exists(PORTFOLIOS_FILE):
-            with open(PORTFOLIOS_FILE, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading portfolios: {e}")
-    return {}
+def new_portfolio_data() -> Dict[str, Any]:
+    """Default portfolio with $100,000 starting cash"""
+    return Portfolio(
+        cash=100000.0,
+        positions={},
+        trades=[],
+        created_at=datetime.now().isoformat(),
+        updated_at=datetime.now().isoformat()
+    ).dict()
 
-def save_portfolios(portfolios_db):
-    """Save portfolios to file"""
-    try:
-        with open(PORTFOLIOS_FILE, 'w') as f:
-            json.dump(portfolios_db, f, indent=2)
-    except Exception as e:
-        print(f"Error saving portfolios: {e}")
+NOT_DURABLE_NOTE = " (applied, but not yet saved to disk; it will be saved when storage recovers)"
 
-# Load existing portfolios or create empty database
-user_portfolios = load_portfolios()
+async def wait_durable(seq: int) -> bool:
+    """Wait for a journal record to be written; False if it is applied but not yet durable"""
+    try:
+        await portfolio_store.wait_committed(seq)
+        return True
+    except JournalWriteError as e:
+        # The change is live in memory and the writer keeps retrying it
+        print(f"Portfolio journal record {seq} not yet durable: {e}")
+        return False
 
 def get_portfolio_data(user_id: str) -> Portfolio:
     """Load portfolio data for user or create default portfolio"""
-    print(f"DEBUG: Looking for user_id: {user_id}")
-    print(f"DEBUG: Available users in portfolios: {list(user_portfolios.keys())}")
+    portfolio_data = portfolio_store.get(user_id)
     
-    if user_id in user_portfolios:
-        print(f"DEBUG: Found existing portfolio for {user_id}")
-        portfolio_data = user_portfolios[user_id].copy()
-        
+    if portfolio_data is not None:
         # Handle legacy data structure - convert 'holdings' to 'positions'
         if 'holdings' in portfolio_data and 'positions' not in portfolio_data:
             print(f"DEBUG: Converting holdings to positions for {user_id}")
             portfolio_data['positions'] = portfolio_data.pop('holdings')
         
         # Ensure required fields exist
-        if 'positions' not in portfolio_data:
-            portfolio_data['positions'] = {}
-        if 'trades' not in portfolio_data:
-            portfolio_data['trades'] = []
-        if 'created_at' not in portfolio_data:
-            portfolio_data['created_at'] = datetime.now().isoformat()
-        if 'updated_at' not in portfolio_data:
-            portfolio_data['updated_at'] = datetime.now().isoformat()
-            
-        print(f"DEBUG: Portfolio data for {user_id} - trades count: {len(portfolio_data.get('trades', []))}")
-        return Portfolio(**portfolio_data)
+        portfolio_data.setdefault('positions', {})
+        portfolio_data.setdefault('trades', [])
+        portfolio_data.setdefault('created_at', datetime.now().isoformat())
+        portfolio_data.setdefault('updated_at', datetime.now().isoformat())
+        
+        # Build without re-validating the whole trade history on every request.
+        # Positions are copied so callers can stage changes before record_trade;
+        # trades are shared and must be treated as read-only.
+        return Portfolio.construct(
+            cash=portfolio_data['cash'],
+            positions=dict(portfolio_data['positions']),
+            trades=portfolio_data['trades'],
+            created_at=portfolio_data['created_at'],
+            updated_at=portfolio_data['updated_at']
+        )
     
     print(f"DEBUG: No existing portfolio found for {user_id}, creating default")
-    # Create default portfolio with $100,000 starting cash
-    default_portfolio = Portfolio(
-        cash=100000.0,
-        positions={},
-        trades=[],
-        created_at=datetime.now().isoformat(),
-        updated_at=datetime.now().isoformat()
-    )
-    user_portfolios[user_id] = default_portfolio.dict()
-    return default_portfolio
+    portfolio_store.put_portfolio(user_id, new_portfolio_data())
+    return get_portfolio_data(user_id)
 
-def save_portfolio_data(user_id: str, portfolio: Portfolio):
-    """Save portfolio data for user"""
-    portfolio.updated_at = datetime.now().isoformat()
-    user_portfolios[user_id] = portfolio.dict()
-    save_portfolios(user_portfolios)  # Save to file
+def portfolio_summary(portfolio: Portfolio) -> Dict[str, Any]:
+    """Portfolio state without the (potentially very large) trade history"""
+    return {
+        "cash": portfolio.cash,
+        "positions": portfolio.positions,
+        "trade_count": len(portfolio.trades),
+        "created_at": portfolio.created_at,
+        "updated_at": portfolio.updated_at
+    }
 
 @router.get("/")
 async def get_portfolio(current_user: dict = Depends(get_current_user)):
@@ -116,177 +120,162 @@ async def execute_trade(trade_request: TradeRequest, current_user: dict = Depend
     """Execute a buy or sell trade"""
     try:
         uid = current_user["uid"]
-        portfolio = get_portfolio_data(uid)
         ticker = trade_request.ticker.upper()
         action = trade_request.action.lower()
         quantity = trade_request.quantity
         price = trade_request.price
         
-        # For market orders (when price is 0 or negative), get current market price
+        # For market orders (when price is 0 or negative), fill at the current quote
+        # from the shared quote book, refreshed upstream if it is stale
         if price <= 0:
-            # Try to get live price from cache first
-            cache_file = f"quote_symbol{ticker.replace(':', '')}.json"
-            cache_path = os.path.join("cache", cache_file)
-            if os.path.exists(cache_path):
-                try:
-                    with open(cache_path, 'r') as f:
-                        cache_data = json.load(f)
-                        cached_price = cache_data.get('data', {}).get('c', 0)
-                        if cached_price > 0:
-                            price = cached_price
-                            print(f"Using cached market price for {ticker}: ${price}")
-                except Exception as e:
-                    print(f"Error reading cached price for {ticker}: {e}")
+            quote = await stock_service.get_live_quote(ticker)
+            if quote is None or quote['stale']:
+                raise HTTPException(status_code=400, detail=f"Unable to get a current market price for {ticker}")
+            price = quote['price']
+            print(f"Using quote book market price for {ticker}: ${price} ({quote['age_seconds']}s old)")
+        
+        # Hold the account lock across the read-modify-write of its portfolio
+        async with portfolio_store.lock(uid):
+            portfolio = get_portfolio_data(uid)
+            
+            if action not in ['buy', 'sell']:
+                raise HTTPException(status_code=400, detail="Action must be 'buy' or 'sell'")
+            
+            if quantity <= 0:
+                raise HTTPException(status_code=400, detail="Quantity must be positive")
             
             if price <= 0:
-                raise HTTPException(status_code=400, detail=f"Unable to get market price for {ticker}")
-        
-        if action not in ['buy', 'sell']:
-            raise HTTPException(status_code=400, detail="Action must be 'buy' or 'sell'")
-        
-        if quantity <= 0:
-            raise HTTPException(status_code=400, detail="Quantity must be positive")
-        
-        if price <= 0:
-            raise HTTPException(status_code=400, detail="Price must be positive")
-        
-        trade_value = quantity * price
-        
-        # Calculate realized P&L for sell trades using FIFO method
-        realized_pnl = 0.0
-        exchange = "Unknown"
-        market_sector = "Unknown"
-        matched_trade_ids = []  # Track which buy trades this sell matches against
-        
-        if action == 'sell' and ticker in portfolio.positions:
-            current_position = portfolio.positions[ticker]
-            # Simple P&L calculation: (sell_price - avg_cost) * quantity_sold
-            realized_pnl = (price - current_position['avg_price']) * quantity
+                raise HTTPException(status_code=400, detail="Price must be positive")
             
-            # For more detailed tracking, find matching buy trades
-            # This creates a paper trail for tax reporting
-            remaining_to_match = quantity
-            for trade in reversed(portfolio.trades):  # FIFO: match oldest buys first
-                if (trade.get('symbol') == ticker and 
-                    trade.get('side') == 'BUY' and 
-                    remaining_to_match > 0):
-                    
-                    # Track which buy trades this sell is matched against
-                    matched_trade_ids.append(trade.get('trade_id', ''))
-                    buy_quantity = trade.get('quantity', 0)
-                    
-                    if buy_quantity <= remaining_to_match:
-                        remaining_to_match -= buy_quantity
-                    else:
-                        remaining_to_match = 0
-        
-        # Try to get exchange and sector info from cache or API
-        try:
-            # Check if we have cached stock profile data
-            cache_file = f"stockprofile2_symbol{ticker}.json"
-            cache_path = os.path.join("cache", cache_file)
-            if os.path.exists(cache_path):
-                with open(cache_path, 'r') as f:
-                    cache_data = json.load(f)
-                    stock_data = cache_data.get('data', {})
-                    exchange = stock_data.get('exchange', 'Unknown')
-                    market_sector = stock_data.get('finnhubIndustry', 'Unknown')
-        except Exception as e:
-            print(f"Could not load stock profile for {ticker}: {e}")
-        
-        # Record the trade with comprehensive data first
-        trade_timestamp = datetime.now()
-        trade_record = {
-            'trade_id': str(uuid.uuid4()),
-            'account_id': uid,
-            'symbol': ticker,
-            'instrument_type': 'stock',  # Default to stock for now
-            'side': 'BUY' if action == 'buy' else 'SELL',
-            'quantity': quantity,
-            'price': price,
-            'trade_date': trade_timestamp.strftime('%Y-%m-%d'),
-            'trade_time': trade_timestamp.strftime('%H:%M:%S'),
-            'commission': trade_request.commission,
-            'currency': 'USD',
-            'gross_value': trade_value,
-            'net_value': trade_value + (trade_request.commission if action == 'buy' else -trade_request.commission),
-            'realized_pnl': realized_pnl,
-            'matched_trade_ids': matched_trade_ids if action == 'sell' else [],  # Track buy/sell relationships
-            'exchange': exchange,
-            'market_sector': market_sector,
-            # Legacy fields for backward compatibility
-            'ticker': ticker,
-            'action': action,
-            'value': trade_value,
-            'timestamp': trade_timestamp.isoformat()
-        }
-        
-        # Apply commission to trade value
-        actual_cost = trade_value + trade_request.commission
-        actual_proceeds = trade_value - trade_request.commission
-        
-        if action == 'buy':
-            # Check if user has enough cash including commission
-            if portfolio.cash < actual_cost:
-                raise HTTPException(status_code=400, detail="Insufficient cash for this trade including commission")
+            trade_value = quantity * price
+            
+            lot_method = (trade_request.lot_method or 'FIFO').upper()
+            if lot_method not in LOT_METHODS:
+                raise HTTPException(status_code=400, detail=f"lot_method must be one of {', '.join(LOT_METHODS)}")
             
-            # Deduct cash (including commission)
-            portfolio.cash -= actual_cost
+            # Average-cost P&L; replaced with lot-based P&L when the sell is matched
+            # against open lots as it is recorded (see PortfolioStore.record_trade)
+            realized_pnl = 0.0
+            exchange = "Unknown"
+            market_sector = "Unknown"
             
-            # Update position
-            if ticker in portfolio.positions:
-                # Calculate new average price
+            if action == 'sell' and ticker in portfolio.positions:
                 current_position = portfolio.positions[ticker]
-                current_quantity = current_position['quantity']
-                current_avg_price = current_position['avg_price']
+                realized_pnl = (price - current_position['avg_price']) * quantity
+            
+            # Try to get exchange and sector info from cache or API
+            try:
+                # Check if we have cached stock profile data
+                cache_file = f"stockprofile2_symbol{ticker}.json"
+                cache_path = os.path.join("cache", cache_file)
+                if os.path.exists(cache_path):
+                    with open(cache_path, 'r') as f:
+                        cache_data = json.load(f)
+                        stock_data = cache_data.get('data', {})
+                        exchange = stock_data.get('exchange', 'Unknown')
+                        market_sector = stock_data.get('finnhubIndustry', 'Unknown')
+            except Exception as e:
+                print(f"Could not load stock profile for {ticker}: {e}")
+            
+            # Record the trade with comprehensive data first
+            trade_timestamp = datetime.now()
+            trade_record = {
+                'trade_id': str(uuid.uuid4()),
+                'account_id': uid,
+                'symbol': ticker,
+                'instrument_type': 'stock',  # Default to stock for now
+                'side': 'BUY' if action == 'buy' else 'SELL',
+                'quantity': quantity,
+                'price': price,
+                'trade_date': trade_timestamp.strftime('%Y-%m-%d'),
+                'trade_time': trade_timestamp.strftime('%H:%M:%S'),
+                'commission': trade_request.commission,
+                'currency': 'USD',
+                'gross_value': trade_value,
+                'net_value': trade_value + (trade_request.commission if action == 'buy' else -trade_request.commission),
+                'realized_pnl': realized_pnl,
+                'matched_trade_ids': [],  # Filled from the lot book for sells
+                'lot_method': lot_method if action == 'sell' else None,
+                'exchange': exchange,
+                'market_sector': market_sector,
+                # Legacy fields for backward compatibility
+                'ticker': ticker,
+                'action': action,
+                'value': trade_value,
+                'timestamp': trade_timestamp.isoformat()
+            }
+            
+            # Apply commission to trade value
+            actual_cost = trade_value + trade_request.commission
+            actual_proceeds = trade_value - trade_request.commission
+            
+            if action == 'buy':
+                # Check if user has enough cash including commission
+                if portfolio.cash < actual_cost:
+                    raise HTTPException(status_code=400, detail="Insufficient cash for this trade including commission")
+            
+                # Deduct cash (including commission)
+                portfolio.cash -= actual_cost
+            
+                # Update position
+                if ticker in portfolio.positions:
+                    # Calculate new average price
+                    current_position = portfolio.positions[ticker]
+                    current_quantity = current_position['quantity']
+                    current_avg_price = current_position['avg_price']
                 
-                total_cost = (current_quantity * current_avg_price) + trade_value
-                new_quantity = current_quantity + quantity
-                new_avg_price = total_cost / new_quantity
+                    total_cost = (current_quantity * current_avg_price) + trade_value
+                    new_quantity = current_quantity + quantity
+                    new_avg_price = total_cost / new_quantity
                 
-                portfolio.positions[ticker] = {
-                    'quantity': new_quantity,
-                    'avg_price': new_avg_price,
-                    'first_purchase': current_position['first_purchase']
-                }
-            else:
-                # New position
-                portfolio.positions[ticker] = {
-                    'quantity': quantity,
-                    'avg_price': price,
-                    'first_purchase': trade_timestamp.isoformat()
-                }
-        
-        elif action == 'sell':
-            # Check if user has the position
-            if ticker not in portfolio.positions:
-                raise HTTPException(status_code=400, detail="You don't own this stock")
+                    portfolio.positions[ticker] = {
+                        'quantity': new_quantity,
+                        'avg_price': new_avg_price,
+                        'first_purchase': current_position['first_purchase']
+                    }
+                else:
+                    # New position
+                    portfolio.positions[ticker] = {
+                        'quantity': quantity,
+                        'avg_price': price,
+                        'first_purchase': trade_timestamp.isoformat()
+                    }
             
-            current_position = portfolio.positions[ticker]
-            if current_position['quantity'] < quantity:
-                raise HTTPException(status_code=400, detail="Insufficient shares to sell")
+            elif action == 'sell':
+                # Check if user has the position
+                if ticker not in portfolio.positions:
+                    raise HTTPException(status_code=400, detail="You don't own this stock")
             
-            # Add cash (minus commission)
-            portfolio.cash += actual_proceeds
+                current_position = portfolio.positions[ticker]
+                if current_position['quantity'] < quantity:
+                    raise HTTPException(status_code=400, detail="Insufficient shares to sell")
             
-            # Update position
-            new_quantity = current_position['quantity'] - quantity
-            if new_quantity == 0:
-                # Remove position completely
-                del portfolio.positions[ticker]
-            else:
-                # Update quantity (keep same avg price)
-                portfolio.positions[ticker]['quantity'] = new_quantity
-        portfolio.trades.append(trade_record)
-        
-        # Save updated portfolio
-        save_portfolio_data(uid, portfolio)
+                # Add cash (minus commission)
+                portfolio.cash += actual_proceeds
+            
+                # Update position
+                new_quantity = current_position['quantity'] - quantity
+                if new_quantity == 0:
+                    # Remove position completely
+                    del portfolio.positions[ticker]
+                else:
+                    # Update quantity; avg_price is re-derived from the lots left open
+                    # once the sell is matched (see PortfolioStore._apply_lot_cost)
+                    portfolio.positions[ticker] = {**current_position, 'quantity': new_quantity}
+            
+            # Append the trade to the journal with the resulting cash and position
+            seq = portfolio_store.record_trade(uid, trade_record, portfolio.cash, {ticker: portfolio.positions.get(ticker)})
+            portfolio = get_portfolio_data(uid)
+            
+        # Respond once the trade's journal record has been group-committed
+        durable = await wait_durable(seq)
         
         return {
             "success": True,
-            "message": f"Successfully {action}ed {quantity} shares of {ticker} at ${price:.2f}",
+            "message": f"Successfully {action}ed {quantity} shares of {ticker} at ${price:.2f}" + ("" if durable else NOT_DURABLE_NOTE),
+            "durable": durable,
             "trade": trade_record,
-            "portfolio": portfolio.dict()
+            "portfolio": portfolio_summary(portfolio)
         }
         
     except HTTPException:
@@ -294,120 +283,254 @@ async def execute_trade(trade_request: TradeRequest, current_user: dict = Depend
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error executing trade: {str(e)}")
 
+@router.get("/lots")
+async def get_open_lots(ticker: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Get open buy lots per symbol (remaining quantity and cost)"""
+    try:
+        uid = current_user["uid"]
+        lots = portfolio_store.get_lots(uid)
+        return {
+            "success": True,
+            "data": lots.open_lots(ticker.upper() if ticker else None)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching open lots: {str(e)}")
+
 @router.get("/trades/pnl-breakdown")
-async def get_pnl_breakdown(current_user: dict = Depends(get_current_user)):
-    """Get detailed P&L breakdown showing buy/sell matches"""
+async def get_pnl_breakdown(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get detailed P&L breakdown showing buy/sell matches (optionally paginated)"""
     try:
         uid = current_user["uid"]
-        portfolio = get_portfolio_data(uid)
+        get_portfolio_data(uid)
+        trade_index = portfolio_store.get_trade_index(uid)
         
         pnl_breakdown = []
         
-        # Find all sell trades and their matched buys
-        for trade in portfolio.trades:
-            if trade.get('side') == 'SELL' and trade.get('matched_trade_ids'):
-                sell_trade = trade
-                matched_buys = []
-                
-                # Find the corresponding buy trades
-                for buy_id in trade.get('matched_trade_ids', []):
-                    for buy_trade in portfolio.trades:
-                        if buy_trade.get('trade_id') == buy_id:
-                            matched_buys.append(buy_trade)
-                            break
-                
-                # Calculate detailed P&L for this sell
-                pnl_breakdown.append({
-                    'sell_trade_id': sell_trade.get('trade_id'),
-                    'symbol': sell_trade.get('symbol'),
-                    'sell_date': sell_trade.get('trade_date'),
-                    'sell_price': sell_trade.get('price'),
-                    'sell_quantity': sell_trade.get('quantity'),
-                    'matched_buys': [
-                        {
-                            'buy_trade_id': buy.get('trade_id'),
-                            'buy_date': buy.get('trade_date'),
-                            'buy_price': buy.get('price'),
-                            'buy_quantity': buy.get('quantity')
-                        } for buy in matched_buys
-                    ],
-                    'realized_pnl': sell_trade.get('realized_pnl', 0),
-                    'commission_total': sell_trade.get('commission', 0) + sum(buy.get('commission', 0) for buy in matched_buys)
-                })
+        # Sells and their lot matches are indexed as trades are recorded
+        for sell_trade in trade_index.get_sells(offset, limit):
+            if not sell_trade.get('matched_trade_ids'):
+                continue
+            
+            # Quantity taken from each lot; legacy sells only have the ids
+            matches = sell_trade.get('lot_matches') or [
+                {'trade_id': buy_id, 'quantity': None} for buy_id in sell_trade['matched_trade_ids']
+            ]
+            
+            matched_buys = []
+            for match in matches:
+                buy = trade_index.get(match['trade_id'])
+                if buy is not None:
+                    matched_buys.append((buy, match['quantity']))
+            
+            pnl_breakdown.append({
+                'sell_trade_id': sell_trade.get('trade_id'),
+                'symbol': sell_trade.get('symbol'),
+                'sell_date': sell_trade.get('trade_date'),
+                'sell_price': sell_trade.get('price'),
+                'sell_quantity': sell_trade.get('quantity'),
+                'lot_method': sell_trade.get('lot_method') or 'FIFO',
+                'matched_buys': [
+                    {
+                        'buy_trade_id': buy.get('trade_id'),
+                        'buy_date': buy.get('trade_date'),
+                        'buy_price': buy.get('price'),
+                        'buy_quantity': buy.get('quantity'),
+                        'matched_quantity': matched_quantity
+                    } for buy, matched_quantity in matched_buys
+                ],
+                'realized_pnl': sell_trade.get('realized_pnl', 0),
+                'commission_total': sell_trade.get('commission', 0) + sum(buy.get('commission', 0) for buy, _ in matched_buys)
+            })
+        
+        total = len(trade_index.sells)
+        next_offset = offset + limit if limit is not None and offset + limit < total else None
         
         return {
             "success": True,
-            "data": pnl_breakdown
+            "data": pnl_breakdown,
+            "pagination": {
+                "offset": offset,
+                "limit": limit,
+                "total_sells": total,
+                "next_offset": next_offset
+            }
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating P&L breakdown: {str(e)}")
 
+EXPORT_HEADERS = [
+    'trade_id', 'account_id', 'symbol', 'instrument_type', 'side', 
+    'quantity', 'price', 'trade_date', 'trade_time', 
+    'commission', 'currency', 'gross_value', 'net_value', 'realized_pnl',
+    'matched_trade_ids', 'exchange', 'market_sector'
+]
+EXPORT_CHUNK_ROWS = 500
+
+def export_row(trade: Dict[str, Any], uid: str) -> List[Any]:
+    """One trade as a list of EXPORT_HEADERS values, filling legacy fields"""
+    return [
+        trade.get('trade_id', ''),
+        trade.get('account_id', uid),
+        trade.get('symbol', trade.get('ticker', '')),
+        trade.get('instrument_type', 'stock'),
+        trade.get('side', trade.get('action', '').upper()),
+        trade.get('quantity', 0),
+        trade.get('price', 0),
+        trade.get('trade_date', ''),
+        trade.get('trade_time', ''),
+        trade.get('commission', 0),
+        trade.get('currency', 'USD'),
+        trade.get('gross_value', trade.get('value', 0)),
+        trade.get('net_value', trade.get('value', 0)),
+        trade.get('realized_pnl', 0),
+        ','.join(trade.get('matched_trade_ids', [])),  # Join IDs with commas
+        trade.get('exchange', 'Unknown'),
+        trade.get('market_sector', 'Unknown')
+    ]
+
+def stream_trades_csv(uid: str, positions, trades: List[Dict[str, Any]]):
+    """Yield the CSV export in chunks of EXPORT_CHUNK_ROWS rows, reusing one small buffer"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    
+    rows = 0
+    for position in positions:
+        writer.writerow(export_row(trades[position], uid))
+        rows += 1
+        if rows % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue().encode('utf-8')
+
+def stream_trades_ndjson(uid: str, positions, trades: List[Dict[str, Any]]):
+    """Yield the NDJSON export (one object per line) in chunks of EXPORT_CHUNK_ROWS rows"""
+    lines = []
+    for position in positions:
+        lines.append(json.dumps(dict(zip(EXPORT_HEADERS, export_row(trades[position], uid)))))
+        if len(lines) == EXPORT_CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode('utf-8')
+            lines = []
+    
+    if lines:
+        yield ("\n".join(lines) + "\n").encode('utf-8')
+
 @router.get("/trades/export")
-async def export_trades_csv(current_user: dict = Depends(get_current_user)):
-    """Export trade history as CSV"""
+async def export_trades_csv(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start_date: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    end_date: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Export trade history as CSV or NDJSON, streamed in chunks"""
     try:
         uid = current_user["uid"]
-        portfolio = get_portfolio_data(uid)
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        headers = [
-            'trade_id', 'account_id', 'symbol', 'instrument_type', 'side', 
-            'quantity', 'price', 'trade_date', 'trade_time', 
-            'commission', 'currency', 'gross_value', 'net_value', 'realized_pnl',
-            'matched_trade_ids', 'exchange', 'market_sector'
-        ]
-        writer.writerow(headers)
+        get_portfolio_data(uid)
+        trade_index = portfolio_store.get_trade_index(uid)
+        positions = trade_index.iter_positions(start_date=start_date, end_date=end_date)
+        
+        if format == "ndjson":
+            body = stream_trades_ndjson(uid, positions, trade_index.trades)
+            media_type = 'application/x-ndjson'
+        else:
+            body = stream_trades_csv(uid, positions, trade_index.trades)
+            media_type = 'text/csv'
+        
+        filename = f"trading_history_{uid}_{datetime.now().strftime('%Y%m%d')}.{format}"
+        return StreamingResponse(
+            body,
+            media_type=media_type,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
         
-        # Write trade data
-        for trade in portfolio.trades:
-            row = [
-                trade.get('trade_id', ''),
-                trade.get('account_id', uid),
-                trade.get('symbol', trade.get('ticker', '')),
-                trade.get('instrument_type', 'stock'),
-                trade.get('side', trade.get('action', '').upper()),
-                trade.get('quantity', 0),
-                trade.get('price', 0),
-                trade.get('trade_date', ''),
-                trade.get('trade_time', ''),
-                trade.get('commission', 0),
-                trade.get('currency', 'USD'),
-                trade.get('gross_value', trade.get('value', 0)),
-                trade.get('net_value', trade.get('value', 0)),
-                trade.get('realized_pnl', 0),
-                ','.join(trade.get('matched_trade_ids', [])),  # Join IDs with commas
-                trade.get('exchange', 'Unknown'),
-                trade.get('market_sector', 'Unknown')
-            ]
-            writer.writerow(row)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exporting trades: {str(e)}")
+
+@router.post("/trades/import")
+async def import_trades(
+    file: UploadFile = File(..., description="CSV with the export's columns, or NDJSON"),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="Defaults from the file extension"),
+    lot_method: str = Query("FIFO"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Import historical trades in bulk; the whole batch is validated and committed atomically"""
+    try:
+        uid = current_user["uid"]
+        lot_method = lot_method.upper()
+        if lot_method not in LOT_METHODS:
+            raise HTTPException(status_code=400, detail=f"lot_method must be one of {', '.join(LOT_METHODS)}")
+        
+        filename = (file.filename or '').lower()
+        file_format = format or ('ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv')
+        content = await file.read()
+        loop = asyncio.get_running_loop()
+        
+        async with portfolio_store.lock(uid):
+            portfolio = get_portfolio_data(uid)
+            try:
+                rows = await loop.run_in_executor(None, parse_trade_file, content, file_format)
+                trades, cash, positions = await loop.run_in_executor(
+                    None, build_import, uid, rows, portfolio.cash, portfolio.positions,
+                    portfolio_store.get_lots(uid), portfolio_store.get_trade_index(uid), lot_method
+                )
+            except TradeImportError as e:
+                raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+            
+            seq = portfolio_store.record_import(uid, trades, cash, positions)
+            portfolio = get_portfolio_data(uid)
         
-        # Prepare response
-        output.seek(0)
-        response = StreamingResponse(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            media_type='text/csv',
-            headers={'Content-Disposition': f'attachment; filename="trading_history_{uid}_{datetime.now().strftime("%Y%m%d")}.csv"'}
-        )
+        durable = await wait_durable(seq)
         
-        return response
+        return {
+            "success": True,
+            "message": f"Imported {len(trades)} trades" + ("" if durable else NOT_DURABLE_NOTE),
+            "durable": durable,
+            "imported": len(trades),
+            "portfolio": portfolio_summary(portfolio)
+        }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error exporting trades: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error importing trades: {str(e)}")
 
 @router.get("/trades")
-async def get_trade_history(current_user: dict = Depends(get_current_user)):
-    """Get trade history"""
+async def get_trade_history(
+    symbol: Optional[str] = None,
+    side: Optional[str] = Query(None, description="BUY or SELL"),
+    start_date: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    end_date: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    sector: Optional[str] = None,
+    cursor: Optional[int] = Query(None, ge=0, description="next_cursor from the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get trade history, optionally filtered and cursor-paginated (all matching trades if no limit)"""
     try:
         uid = current_user["uid"]
-        portfolio = get_portfolio_data(uid)
+        get_portfolio_data(uid)
+        trades, next_cursor = portfolio_store.get_trade_index(uid).query(
+            limit=limit,
+            symbol=symbol.upper() if symbol else None,
+            side=side.upper() if side else None,
+            start_date=start_date,
+            end_date=end_date,
+            sector=sector,
+            cursor=cursor,
+            descending=order == "desc"
+        )
         return {
             "success": True,
-            "data": portfolio.trades
+            "data": trades,
+            "next_cursor": next_cursor
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching trade history: {str(e)}")
@@ -419,12 +542,11 @@ async def get_portfolio_stats(current_user: dict = Depends(get_current_user)):
         uid = current_user["uid"]
         portfolio = get_portfolio_data(uid)
         
-        # Calculate total realized P&L from all trades
-        total_realized_pnl = sum(trade.get('realized_pnl', 0) for trade in portfolio.trades)
-        
-        # Calculate actual initial investment from trade history
-        total_cash_spent = sum(trade.get('net_value', 0) for trade in portfolio.trades if trade.get('side') == 'BUY')
-        total_cash_received = sum(trade.get('net_value', 0) for trade in portfolio.trades if trade.get('side') == 'SELL')
+        # Running totals maintained as trades are recorded
+        totals = portfolio_store.get_aggregates(uid).totals
+        total_realized_pnl = totals['total_realized_pnl']
+        total_cash_spent = totals['total_cash_spent']
+        total_cash_received = totals['total_cash_received']
         net_cash_invested = total_cash_spent - total_cash_received
         
         # Use net cash invested as the initial value for return calculation
@@ -441,7 +563,7 @@ async def get_portfolio_stats(current_user: dict = Depends(get_current_user)):
                 "positions": portfolio.positions,
                 "total_realized_pnl": total_realized_pnl,
                 "initial_value": initial_value,
-                "trade_count": len(portfolio.trades),
+                "trade_count": totals['trade_count'],
                 "total_cash_spent": total_cash_spent,
                 "total_cash_received": total_cash_received,
                 "net_cash_invested": net_cash_invested
@@ -450,40 +572,74 @@ async def get_portfolio_stats(current_user: dict = Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating portfolio stats: {str(e)}")
 
+@router.get("/stats/rollups")
+async def get_portfolio_rollups(current_user: dict = Depends(get_current_user)):
+    """Get per-symbol and per-day trade totals"""
+    try:
+        uid = current_user["uid"]
+        get_portfolio_data(uid)
+        aggregates = portfolio_store.get_aggregates(uid)
+        return {
+            "success": True,
+            "data": {
+                "by_symbol": aggregates.by_symbol,
+                "by_day": aggregates.by_day
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching portfolio rollups: {str(e)}")
+
+@router.get("/valuation")
+async def get_portfolio_valuation(
+    wait: float = Query(5.0, ge=0, le=30, description="Seconds to wait for quote refreshes"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Mark every position to market: value, unrealized P&L, weight and day change per position and in total"""
+    try:
+        uid = current_user["uid"]
+        portfolio = get_portfolio_data(uid)
+        
+        # One batch lookup against the quote book; missing or stale quotes refresh concurrently
+        quotes = await stock_service.get_live_quotes(list(portfolio.positions), wait_seconds=wait)
+        
+        return {
+            "success": True,
+            "data": value_portfolio(portfolio.cash, portfolio.positions, quotes)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error valuing portfolio: {str(e)}")
+
 @router.get("/live-price/{ticker}")
 async def get_live_price(ticker: str, current_user: dict = Depends(get_current_user)):
     """Get current live price for a ticker"""
     try:
         ticker = ticker.upper()
         
-        # Try to get live price from cache
-        cache_file = f"quote_symbol{ticker.replace(':', '')}.json"
-        cache_path = os.path.join("cache", cache_file)
+        # Latest quote from the shared quote book (streamed or fetched)
+        quote = await stock_service.get_live_quote(ticker)
+        if quote is None:
+            raise HTTPException(status_code=404, detail=f"No price data available for {ticker}")
         
-        if os.path.exists(cache_path):
-            with open(cache_path, 'r') as f:
-                cache_data = json.load(f)
-                price_data = cache_data.get('data', {})
-                current_price = price_data.get('c', 0)
-                
-                if current_price > 0:
-                    return {
-                        "success": True,
-                        "data": {
-                            "ticker": ticker,
-                            "price": current_price,
-                            "change": price_data.get('d', 0),
-                            "change_percent": price_data.get('dp', 0),
-                            "high": price_data.get('h', 0),
-                            "low": price_data.get('l', 0),
-                            "open": price_data.get('o', 0),
-                            "previous_close": price_data.get('pc', 0),
-                            "timestamp": cache_data.get('timestamp', '')
-                        }
-                    }
-        
-        raise HTTPException(status_code=404, detail=f"No price data available for {ticker}")
+        return {
+            "success": True,
+            "data": {
+                "ticker": ticker,
+                "price": quote['price'],
+                "change": quote['change'],
+                "change_percent": quote['change_percent'],
+                "high": quote['high'],
+                "low": quote['low'],
+                "open": quote['open'],
+                "previous_close": quote['previous_close'],
+                "timestamp": datetime.fromtimestamp(quote['updated_at']).isoformat(),
+                "age_seconds": quote['age_seconds'],
+                "stale": quote['stale'],
+                "source": quote['source']
+            }
+        }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching live price: {str(e)}")
 
@@ -492,19 +648,16 @@ async def reset_portfolio(current_user: dict = Depends(get_current_user)):
     """Reset portfolio to initial state (for testing)"""
     try:
         uid = current_user["uid"]
-        default_portfolio = Portfolio(
-            cash=100000.0,
-            positions={},
-            trades=[],
-            created_at=datetime.now().isoformat(),
-            updated_at=datetime.now().isoformat()
-        )
-        save_portfolio_data(uid, default_portfolio)
+        default_portfolio = new_portfolio_data()
+        async with portfolio_store.lock(uid):
+            seq = portfolio_store.put_portfolio(uid, default_portfolio)
+        durable = await wait_durable(seq)
         
         return {
             "success": True,
-            "message": "Portfolio reset successfully",
-            "data": default_portfolio.dict()
+            "message": "Portfolio reset successfully" + ("" if durable else NOT_DURABLE_NOTE),
+            "durable": durable,
+            "data": default_portfolio
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error resetting portfolio: {str(e)}")
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query, Path
 from typing import List, Optional
 from pydantic import BaseModel
 from core.stock_service import stock_service
+from core.price_hub import price_hub
+from core.bar_aggregator import bar_aggregator
 from core.ai_service_simple import AIAnalysisService
 
 # Create AI service instance
@@ -9,6 +12,12 @@ ai_service = AIAnalysisService()
 
 router = APIRouter()
 
+# Maximum number of symbols accepted by the batch quotes endpoint
+MAX_BATCH_SYMBOLS = 100
+
+# Ticker symbols as Finnhub streams them (e.g. AAPL, BRK.B, BINANCE:BTCUSDT)
+TICKER_PATTERN = r"^[A-Za-z0-9.:\-]{1,20}$"
+
 class StockAnalysisRequest(BaseModel):
     ticker: str
     investor_level: str = "Beginner"
@@ -48,6 +57,52 @@ async def get_stock_data(
         }
     return data
 
+@router.get("/quotes")
+async def get_quotes(
+    symbols: str = Query(..., description="Comma-separated ticker symbols"),
+    include_profile: bool = True,
+    wait: float = Query(5.0, ge=0, le=30, description="Seconds to wait for uncached symbols")
+):
+    """Get quotes for many symbols in one columnar response.
+
+    Symbols not resolved within `wait` seconds are listed under `pending`;
+    they keep loading server-side, so polling again returns them from cache.
+    """
+    tickers = [s.strip() for s in symbols.split(",") if s.strip()]
+    if len(tickers) > MAX_BATCH_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SYMBOLS} symbols per request")
+    return await stock_service.get_quotes_batch(tickers, include_profile=include_profile, wait_seconds=wait)
+
+@router.get("/intraday/{ticker}")
+async def get_intraday_bars(
+    ticker: str = Path(..., pattern=TICKER_PATTERN),
+    interval: str = "1m",
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """Get intraday OHLCV bars aggregated from the live trade stream.
+
+    The first request for a ticker starts streaming it, so bars accumulate from then on.
+    Each request renews the server-side watch; it lapses (and its bars are freed) once
+    the ticker goes unrequested for the hub's watch TTL. When the hub is already
+    watching its maximum number of tickers, new ones are not streamed (`watching` is false).
+    """
+    if interval not in bar_aggregator.intervals:
+        raise HTTPException(status_code=400, detail=f"Interval must be one of {list(bar_aggregator.intervals)}")
+    
+    ticker = ticker.upper()
+    rejected = await price_hub.watch([ticker])
+    bars = bar_aggregator.get_bars(ticker, interval, limit)
+    
+    return {
+        "ticker": ticker,
+        "interval": interval,
+        "watching": not rejected,
+        "streaming": price_hub.is_streaming(ticker),
+        "has_data": bool(bars and bars["timestamps"]),
+        **(bars or {"timestamps": [], "open_prices": [], "high_prices": [], "low_prices": [],
+                    "close_prices": [], "volumes": [], "trade_counts": []})
+    }
+
 @router.get("/info/{ticker}")
 async def get_stock_info(ticker: str):
     """Get basic stock information."""
@@ -64,6 +119,11 @@ async def get_stock_info(ticker: str):
         }
     return data
 
+@router.get("/rate-limits")
+async def get_rate_limits():
+    """Get remaining upstream API budget per provider."""
+    return stock_service.get_rate_limit_budget()
+
 @router.get("/news/{ticker}")
 async def get_stock_news(ticker: str):
     """Get financial news for a stock."""
@@ -94,12 +154,13 @@ async def get_ai_analysis(request: StockAnalysisRequest):
 @router.post("/ai/comparison")
 async def get_ai_comparison(request: ComparisonRequest):
     """Get AI comparison between two stocks."""
-    news1 = await stock_service.get_financial_news(request.ticker1)
-    news2 = await stock_service.get_financial_news(request.ticker2)
-    
-    # Get stock data for both tickers
-    stock1_info = await stock_service.get_stock_info(request.ticker1)
-    stock2_info = await stock_service.get_stock_info(request.ticker2)
+    # Fetch news and stock data for both tickers concurrently
+    news1, news2, stock1_info, stock2_info = await asyncio.gather(
+        stock_service.get_financial_news(request.ticker1),
+        stock_service.get_financial_news(request.ticker2),
+        stock_service.get_stock_info(request.ticker1),
+        stock_service.get_stock_info(request.ticker2)
+    )
     
     # Prepare data for comparison
     stock1_data = {
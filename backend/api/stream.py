@@ -0,0 +1,57 @@
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from typing import Optional
+from core.price_hub import price_hub
+from api.auth import get_user_from_token
+
+router = APIRouter()
+
+@router.websocket("/prices")
+async def stream_prices(websocket: WebSocket, token: Optional[str] = None, interval: Optional[float] = None):
+    """Stream conflated live trades for subscribed symbols.
+
+    Browsers can't set an Authorization header on a WebSocket, so the same bearer
+    token the REST API takes is passed as the `token` query parameter.
+
+    Client messages: {"type": "subscribe" | "unsubscribe", "symbols": [...]}
+    Server messages: {"type": "trades", "data": [{"symbol", "price", "ts", "size", "volume"}]}
+                     {"type": "error", "message": ..., "symbols": [...]} for refused subscriptions
+                     {"type": "error", "message": ...} for malformed messages
+
+    A single symbol may be sent as a string instead of a one-element list.
+    """
+    try:
+        get_user_from_token(token or "")
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscriber = price_hub.connect(websocket.send_json, interval)
+    try:
+        while True:
+            message = await websocket.receive_json()
+            symbols = message.get("symbols") if isinstance(message, dict) else None
+            if isinstance(symbols, str):
+                symbols = [symbols]
+            if not isinstance(symbols, list) or not all(isinstance(s, str) for s in symbols):
+                await websocket.send_json({
+                    "type": "error",
+                    "message": "Expected {\"type\": \"subscribe\" | \"unsubscribe\", \"symbols\": [...]}"
+                })
+                continue
+            if message.get("type") == "subscribe":
+                rejected = await price_hub.subscribe(subscriber, symbols)
+                if rejected:
+                    await websocket.send_json({
+                        "type": "error",
+                        "message": f"At most {price_hub.max_symbols_per_client} symbols per connection",
+                        "symbols": rejected
+                    })
+            elif message.get("type") == "unsubscribe":
+                await price_hub.unsubscribe(subscriber, symbols)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Price stream error: {e}")
+    finally:
+        await price_hub.disconnect(subscriber)
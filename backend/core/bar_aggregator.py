@@ -0,0 +1,129 @@
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+# Bar interval name -> (seconds per bar, bars kept per symbol)
+DEFAULT_INTERVALS = {
+    '1s': (1, 900),      # last 15 minutes
+    '1m': (60, 1440),    # last 24 hours
+    '5m': (300, 2016),   # last 7 days
+}
+
+
+class BarRing:
+    def __init__(self, seconds: int, capacity: int):
+        """
+        Fixed-size ring buffer of OHLCV bars for one symbol and interval
+
+        All arrays are allocated up front; once full, the oldest bar is
+        overwritten, so memory use never grows with the number of trades.
+
+        Args:
+            seconds: Bar length in seconds
+            capacity: Number of bars kept
+        """
+        self.seconds = seconds
+        self.capacity = capacity
+        self.start = np.zeros(capacity, dtype='i8')  # bar open time, unix seconds
+        self.open = np.zeros(capacity, dtype='f8')
+        self.high = np.zeros(capacity, dtype='f8')
+        self.low = np.zeros(capacity, dtype='f8')
+        self.close = np.zeros(capacity, dtype='f8')
+        self.volume = np.zeros(capacity, dtype='f8')
+        self.trades = np.zeros(capacity, dtype='i8')
+        self.head = -1  # index of the newest bar
+        self.count = 0
+
+    @staticmethod
+    def bytes_for(capacity: int) -> int:
+        """Memory used by a ring of this capacity: seven 8-byte columns"""
+        return capacity * 7 * 8
+
+    def add(self, ts_seconds: float, price: float, size: float):
+        """Fold one trade into the current bar, opening a new bar when the interval rolls over"""
+        bucket = int(ts_seconds) // self.seconds * self.seconds
+
+        if self.count and bucket == self.start[self.head]:
+            i = self.head
+            if price > self.high[i]:
+                self.high[i] = price
+            if price < self.low[i]:
+                self.low[i] = price
+            self.close[i] = price
+            self.volume[i] += size
+            self.trades[i] += 1
+            return
+
+        # Late prints for an already closed bar are dropped
+        if self.count and bucket < self.start[self.head]:
+            return
+
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        i = self.head
+        self.start[i] = bucket
+        self.open[i] = self.high[i] = self.low[i] = self.close[i] = price
+        self.volume[i] = size
+        self.trades[i] = 1
+
+    def latest(self, limit: Optional[int] = None) -> Dict[str, List[Any]]:
+        """Newest bars in chronological order, as lists of columns"""
+        n = self.count if limit is None else max(0, min(limit, self.count))
+        idx = (np.arange(self.head - n + 1, self.head + 1)) % self.capacity
+        return {
+            'timestamps': self.start[idx].tolist(),
+            'open_prices': self.open[idx].tolist(),
+            'high_prices': self.high[idx].tolist(),
+            'low_prices': self.low[idx].tolist(),
+            'close_prices': self.close[idx].tolist(),
+            'volumes': self.volume[idx].tolist(),
+            'trade_counts': self.trades[idx].tolist(),
+        }
+
+
+class BarAggregator:
+    def __init__(self, intervals: Dict[str, tuple] = None):
+        """
+        Rolls streamed trades into OHLCV bars per symbol and interval
+
+        Args:
+            intervals: Interval name -> (seconds per bar, bars kept)
+        """
+        self.intervals = intervals or DEFAULT_INTERVALS
+        self.rings: Dict[str, Dict[str, BarRing]] = {}
+
+    def on_trade(self, symbol: str, price: float, ts_ms: int, size: float):
+        """Trade listener for the price hub"""
+        rings = self.rings.get(symbol)
+        if rings is None:
+            rings = {name: BarRing(seconds, capacity) for name, (seconds, capacity) in self.intervals.items()}
+            self.rings[symbol] = rings
+
+        ts_seconds = ts_ms / 1000.0
+        for ring in rings.values():
+            ring.add(ts_seconds, price, size)
+
+    def get_bars(self, symbol: str, interval: str, limit: Optional[int] = None) -> Optional[Dict[str, List[Any]]]:
+        """Bars for a symbol, or None if no trades have been seen for it"""
+        rings = self.rings.get(symbol.upper())
+        if rings is None:
+            return None
+        return rings[interval].latest(limit)
+
+    def release(self, symbol: str):
+        """Release listener for the price hub: free a symbol's rings once it stops streaming"""
+        self.rings.pop(symbol.upper(), None)
+
+    def bytes_per_symbol(self) -> int:
+        return sum(BarRing.bytes_for(capacity) for _, capacity in self.intervals.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'symbols': len(self.rings),
+            'intervals': {name: {'seconds': s, 'capacity': c} for name, (s, c) in self.intervals.items()},
+            'bytes_per_symbol': self.bytes_per_symbol(),
+            'total_bytes': self.bytes_per_symbol() * len(self.rings)
+        }
+
+
+# Global aggregator instance, fed by the price hub
+bar_aggregator = BarAggregator()
@@ -1,25 +1,41 @@
 import json
 import os
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 from pathlib import Path
 
 class StockDataCache:
-    def __init__(self, cache_dir: str = "cache", cache_duration_hours: int = 24):
+    def __init__(self, cache_dir: str = "cache", cache_duration_hours: int = 24,
+                 max_memory_entries: int = 512, max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_file_entries: Optional[int] = None, max_file_bytes: Optional[int] = None):
         """
-        Simple file-based cache for stock data
+        Simple file-based cache for stock data with a bounded LRU memory tier
         
         Args:
             cache_dir: Directory to store cache files
-            cache_duration_hours: How long cache entries are valid (default 24 hours)
+            cache_duration_hours: Default validity for entries set without a ttl (default 24 hours)
+            max_memory_entries: Maximum number of entries held in memory
+            max_memory_bytes: Maximum serialized size of all entries held in memory
+            max_file_entries: Maximum number of cache files (unbounded if None)
+            max_file_bytes: Maximum total size of cache files (unbounded if None)
         """
         self.cache_dir = Path(cache_dir)
         self.cache_duration_hours = cache_duration_hours
-        self.memory_cache = {}  # In-memory cache for faster access
+        self.max_memory_entries = max_memory_entries
+        self.max_memory_bytes = max_memory_bytes
+        # In-memory LRU cache: key -> (cache_data, size_bytes), least recently used first
+        self.memory_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.memory_bytes = 0
+        self.memory_evictions = 0
+        # File tier budget; oldest files are removed first when it is exceeded
+        self.max_file_entries = max_file_entries
+        self.max_file_bytes = max_file_bytes
+        self.file_evictions = 0
         
         # Create cache directory if it doesn't exist
-        self.cache_dir.mkdir(exist_ok=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
         
         # Clean up expired cache files on startup
         self._cleanup_expired_cache()
@@ -32,6 +48,10 @@ class StockDataCache:
     
     def _is_cache_valid(self, cache_data: Dict[str, Any]) -> bool:
         """Check if cached data is still valid"""
+        if 'expires_at' in cache_data:
+            return datetime.now() < datetime.fromisoformat(cache_data['expires_at'])
+        
+        # Legacy entries written before per-entry expiry fall back to the default duration
         if 'timestamp' not in cache_data:
             return False
         
@@ -40,6 +60,53 @@ class StockDataCache:
         
         return datetime.now() < expiry_time
     
+    def _memory_put(self, cache_key: str, cache_data: Dict[str, Any], size_bytes: int):
+        """Insert an entry into the memory tier and evict least recently used entries over budget"""
+        self._memory_remove(cache_key)
+        
+        # Entries larger than the whole budget are served from the file tier only
+        if size_bytes > self.max_memory_bytes:
+            return
+        
+        self.memory_cache[cache_key] = (cache_data, size_bytes)
+        self.memory_bytes += size_bytes
+        
+        while (len(self.memory_cache) > self.max_memory_entries or
+               self.memory_bytes > self.max_memory_bytes):
+            _, (_, evicted_size) = self.memory_cache.popitem(last=False)
+            self.memory_bytes -= evicted_size
+            self.memory_evictions += 1
+    
+    def _memory_remove(self, cache_key: str):
+        """Remove an entry from the memory tier if present"""
+        entry = self.memory_cache.pop(cache_key, None)
+        if entry is not None:
+            self.memory_bytes -= entry[1]
+    
+    def _enforce_file_budget(self):
+        """Delete the least recently written cache files until the file tier is within budget"""
+        if self.max_file_entries is None and self.max_file_bytes is None:
+            return
+        try:
+            files = [(f.stat().st_mtime, f.stat().st_size, f) for f in self.cache_dir.glob("*.json")]
+        except OSError as e:
+            print(f"Error checking cache size: {e}")
+            return
+        files.sort(key=lambda item: item[0])
+        total_bytes = sum(size for _, size, _ in files)
+        
+        while files and ((self.max_file_entries is not None and len(files) > self.max_file_entries) or
+                         (self.max_file_bytes is not None and total_bytes > self.max_file_bytes)):
+            _, size, cache_file = files.pop(0)
+            try:
+                cache_file.unlink()
+            except FileNotFoundError:
+                pass
+            self._memory_remove(cache_file.stem)
+            total_bytes -= size
+            self.file_evictions += 1
+            print(f"Cache EVICTED: {cache_file.name}")
+    
     def _cleanup_expired_cache(self):
         """Remove expired cache files"""
         try:
@@ -71,13 +138,16 @@ class StockDataCache:
             Cached data if valid, None if not found or expired
         """
         # Check memory cache first
-        if cache_key in self.memory_cache:
-            if self._is_cache_valid(self.memory_cache[cache_key]):
+        entry = self.memory_cache.get(cache_key)
+        if entry is not None:
+            cache_data = entry[0]
+            if self._is_cache_valid(cache_data):
+                self.memory_cache.move_to_end(cache_key)
                 print(f"Cache HIT (memory): {cache_key}")
-                return self.memory_cache[cache_key]['data']
+                return cache_data['data']
             else:
                 # Remove expired data from memory
-                del self.memory_cache[cache_key]
+                self._memory_remove(cache_key)
         
         # Check file cache
         cache_file = self._get_cache_file_path(cache_key)
@@ -89,7 +159,7 @@ class StockDataCache:
                 
                 if self._is_cache_valid(cache_data):
                     # Load into memory cache for faster future access
-                    self.memory_cache[cache_key] = cache_data
+                    self._memory_put(cache_key, cache_data, cache_file.stat().st_size)
                     print(f"Cache HIT (file): {cache_key}")
                     return cache_data['data']
                 else:
@@ -105,38 +175,46 @@ class StockDataCache:
         print(f"Cache MISS: {cache_key}")
         return None
     
-    def set(self, cache_key: str, data: Dict[str, Any]):
+    def set(self, cache_key: str, data: Dict[str, Any], ttl: Optional[timedelta] = None):
         """
         Store data in cache
         
         Args:
             cache_key: Unique identifier for the data
             data: Data to cache
+            ttl: How long this entry is valid (defaults to cache_duration_hours)
         """
+        if ttl is None:
+            ttl = timedelta(hours=self.cache_duration_hours)
+        
+        now = datetime.now()
         cache_data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now.isoformat(),
+            'expires_at': (now + ttl).isoformat(),
             'data': data
         }
+        serialized = json.dumps(cache_data)
         
         # Store in memory cache
-        self.memory_cache[cache_key] = cache_data
+        self._memory_put(cache_key, cache_data, len(serialized))
         
         # Store in file cache
         cache_file = self._get_cache_file_path(cache_key)
         
         try:
             with open(cache_file, 'w') as f:
-                json.dump(cache_data, f, indent=2)
-            print(f"Cache SET: {cache_key}")
+                f.write(serialized)
+            print(f"Cache SET: {cache_key} (ttl {ttl})")
         
         except Exception as e:
             print(f"Error writing cache file {cache_key}: {e}")
+        
+        self._enforce_file_budget()
     
     def delete(self, cache_key: str):
         """Delete specific cache entry"""
         # Remove from memory
-        if cache_key in self.memory_cache:
-            del self.memory_cache[cache_key]
+        self._memory_remove(cache_key)
         
         # Remove from file
         cache_file = self._get_cache_file_path(cache_key)
@@ -148,6 +226,7 @@ class StockDataCache:
         """Clear all cache data"""
         # Clear memory cache
         self.memory_cache.clear()
+        self.memory_bytes = 0
         
         # Clear file cache
         for cache_file in self.cache_dir.glob("*.json"):
@@ -168,6 +247,11 @@ class StockDataCache:
         return {
             'file_cache_entries': file_count,
             'memory_cache_entries': memory_count,
+            'memory_cache_bytes': self.memory_bytes,
+            'memory_cache_evictions': self.memory_evictions,
+            'file_cache_evictions': self.file_evictions,
+            'max_memory_entries': self.max_memory_entries,
+            'max_memory_bytes': self.max_memory_bytes,
             'total_size_bytes': total_size,
             'total_size_mb': round(total_size / (1024 * 1024), 2),
             'cache_duration_hours': self.cache_duration_hours
@@ -185,6 +269,7 @@ class StockDataCache:
                 items.append({
                     'key': cache_file.stem,
                     'timestamp': cache_data.get('timestamp'),
+                    'expires_at': cache_data.get('expires_at'),
                     'valid': self._is_cache_valid(cache_data),
                     'size_bytes': cache_file.stat().st_size
                 })
@@ -201,3 +286,12 @@ class StockDataCache:
 # Global cache instance
 cache_dir = Path(__file__).parent.parent / "cache"  # backend/cache relative to this file
 stock_cache = StockDataCache(cache_dir=str(cache_dir), cache_duration_hours=24)
+
+# AI coach responses, content-addressed by a hash of the request (see api.ai_coach)
+llm_cache = StockDataCache(
+    cache_dir=str(cache_dir / "llm"),
+    cache_duration_hours=int(os.getenv("LLM_CACHE_TTL_HOURS", "24")),
+    max_memory_entries=64,
+    max_file_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500")),
+    max_file_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "50")) * 1024 * 1024
+)
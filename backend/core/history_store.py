@@ -0,0 +1,161 @@
+import os
+import time
+from datetime import date
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# One record per trading day; columns are read as zero-copy views of this array
+BAR_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'i8'),
+])
+
+
+class PriceHistory:
+    def __init__(self, bars: np.ndarray, fetched_at: float):
+        """
+        Daily OHLCV bars for one ticker, sorted by date
+
+        Args:
+            bars: Structured array with BAR_DTYPE, ascending by date
+            fetched_at: Unix time the bars were last refreshed from upstream
+        """
+        self.bars = bars
+        self.fetched_at = fetched_at
+
+    @classmethod
+    def from_alpha_vantage(cls, time_series: Dict[str, Dict[str, str]]) -> "PriceHistory":
+        """Parse an Alpha Vantage 'Time Series (Daily)' payload once into columnar form"""
+        bars = np.empty(len(time_series), dtype=BAR_DTYPE)
+        for i, date_str in enumerate(sorted(time_series)):
+            values = time_series[date_str]
+            bars[i] = (
+                date_str,
+                values['1. open'],
+                values['2. high'],
+                values['3. low'],
+                values['4. close'],
+                values['5. volume'],
+            )
+        return cls(bars, time.time())
+
+    def __len__(self) -> int:
+        return len(self.bars)
+
+    def days_since_last_bar(self) -> Optional[int]:
+        """Calendar days between the newest stored bar and today"""
+        if not len(self.bars):
+            return None
+        return int((np.datetime64(date.today(), 'D') - self.bars['date'][-1]).astype(int))
+
+    def covers_gap_to(self, newer: "PriceHistory") -> bool:
+        """Whether newer bars overlap or directly follow these, so merging leaves no gap"""
+        if not len(self.bars) or not len(newer.bars):
+            return False
+        return newer.bars['date'][0] <= self.bars['date'][-1]
+
+    def merge(self, newer: "PriceHistory") -> "PriceHistory":
+        """Append newer bars, letting them replace any overlapping (possibly revised) days"""
+        cutoff = np.searchsorted(self.bars['date'], newer.bars['date'][0], side='left')
+        bars = np.concatenate([self.bars[:cutoff], newer.bars])
+        return PriceHistory(bars, newer.fetched_at)
+
+    def is_fresh(self, max_age_seconds: float) -> bool:
+        return time.time() - self.fetched_at < max_age_seconds
+
+    def slice(self, start_date: str, end_date: str) -> np.ndarray:
+        """Bars between start_date and end_date inclusive (binary search, no copy)"""
+        dates = self.bars['date']
+        start = np.searchsorted(dates, np.datetime64(start_date, 'D'), side='left')
+        end = np.searchsorted(dates, np.datetime64(end_date, 'D'), side='right')
+        return self.bars[start:end]
+
+    @staticmethod
+    def to_chart_data(bars: np.ndarray) -> Dict[str, List[Any]]:
+        """Convert a slice of bars into the list-of-columns shape the frontend expects"""
+        return {
+            'dates': np.datetime_as_string(bars['date'], unit='D').tolist(),
+            'open_prices': bars['open'].tolist(),
+            'high_prices': bars['high'].tolist(),
+            'low_prices': bars['low'].tolist(),
+            'close_prices': bars['close'].tolist(),
+            'volumes': bars['volume'].tolist(),
+        }
+
+
+class HistoryStore:
+    def __init__(self, store_dir: str):
+        """
+        Per-ticker daily history kept in memory and on disk as .npy files
+
+        Files are read whole into memory on load (a few hundred KB even for
+        decades of bars) rather than memory-mapped: a mapped file can't be
+        replaced on Windows, which would stop refreshed history being saved.
+
+        Args:
+            store_dir: Directory holding one {TICKER}.npy file per ticker
+        """
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.histories: Dict[str, PriceHistory] = {}
+
+    def _get_file_path(self, ticker: str) -> Path:
+        safe_ticker = "".join(c for c in ticker.upper() if c.isalnum() or c in ('-', '_', '.'))
+        return self.store_dir / f"{safe_ticker}.npy"
+
+    def get(self, ticker: str) -> Optional[PriceHistory]:
+        """Get a ticker's history from memory, falling back to the on-disk store"""
+        ticker = ticker.upper()
+        history = self.histories.get(ticker)
+        if history is not None:
+            return history
+
+        path = self._get_file_path(ticker)
+        if not path.exists():
+            return None
+
+        try:
+            # Read into memory and release the file, so put() can replace it later
+            bars = np.load(path)
+            history = PriceHistory(bars, path.stat().st_mtime)
+            self.histories[ticker] = history
+            return history
+        except Exception as e:
+            print(f"Error loading history for {ticker}: {e}")
+            return None
+
+    def put(self, ticker: str, history: PriceHistory):
+        """Store a ticker's history in memory and atomically on disk"""
+        ticker = ticker.upper()
+        self.histories[ticker] = history
+
+        path = self._get_file_path(ticker)
+        tmp_path = path.with_suffix('.tmp.npy')
+        try:
+            np.save(tmp_path, np.ascontiguousarray(history.bars))
+            os.replace(tmp_path, path)
+            # Keep the on-disk mtime in step with the refresh time
+            os.utime(path, (history.fetched_at, history.fetched_at))
+            print(f"History SET: {ticker} ({len(history)} bars)")
+        except Exception as e:
+            # e.g. the file is locked by another process; keep serving from memory
+            print(f"Error writing history for {ticker}: {e}")
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def delete(self, ticker: str):
+        ticker = ticker.upper()
+        self.histories.pop(ticker, None)
+        path = self._get_file_path(ticker)
+        if path.exists():
+            path.unlink()
+
+    def clear_all(self):
+        self.histories.clear()
+        for path in self.store_dir.glob("*.npy"):
+            path.unlink()
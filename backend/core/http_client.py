@@ -0,0 +1,82 @@
+import asyncio
+import httpx
+from typing import Any, Dict, Optional
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 support in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Connection pool settings per upstream host. HTTP/2 is negotiated via ALPN,
+# so hosts that only speak HTTP/1.1 fall back transparently.
+PROVIDER_POOLS = {
+    'finnhub': {'max_connections': 20, 'max_keepalive_connections': 10, 'http2': True},
+    'alphavantage': {'max_connections': 5, 'max_keepalive_connections': 2, 'http2': True},
+    'newsapi': {'max_connections': 5, 'max_keepalive_connections': 2, 'http2': True},
+}
+
+
+class UpstreamHTTPClient:
+    def __init__(self, timeout: float = 30.0, keepalive_expiry: float = 30.0):
+        """
+        Shared, long-lived async HTTP clients for upstream market data providers
+
+        Each provider gets its own connection pool so one slow host cannot
+        exhaust connections needed by another.
+
+        Args:
+            timeout: Total request timeout in seconds
+            keepalive_expiry: How long idle keep-alive connections are kept open
+        """
+        self.timeout = httpx.Timeout(timeout, connect=10.0)
+        self.keepalive_expiry = keepalive_expiry
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._client_loops: Dict[str, asyncio.AbstractEventLoop] = {}
+
+    def _get_client(self, provider: str) -> httpx.AsyncClient:
+        """Get (or lazily create) the pooled client for a provider on the running loop"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(provider)
+
+        # A client is bound to the loop it was created on; scripts using
+        # asyncio.run() get a fresh pool per run
+        if client is not None and self._client_loops.get(provider) is loop and not client.is_closed:
+            return client
+
+        pool = PROVIDER_POOLS.get(provider, {'max_connections': 10, 'max_keepalive_connections': 5, 'http2': False})
+        client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=pool['max_connections'],
+                max_keepalive_connections=pool['max_keepalive_connections'],
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            http2=pool['http2'] and HTTP2_AVAILABLE
+        )
+        self._clients[provider] = client
+        self._client_loops[provider] = loop
+        return client
+
+    async def get_json(self, provider: str, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        GET a URL through the provider's pool and decode the JSON body
+
+        Raises:
+            httpx.HTTPError: On transport errors or non-2xx responses
+        """
+        response = await self._get_client(provider).get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        """Close all pooled connections"""
+        for client in self._clients.values():
+            if not client.is_closed:
+                await client.aclose()
+        self._clients.clear()
+        self._client_loops.clear()
+
+
+# Global client instance shared by all upstream services
+http_client = UpstreamHTTPClient()
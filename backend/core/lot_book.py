@@ -0,0 +1,173 @@
+import heapq
+import itertools
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# Lot selection methods for sells
+LOT_METHODS = ('FIFO', 'LIFO', 'HIFO')
+
+
+class OpenLot:
+    __slots__ = ('trade_id', 'price', 'quantity', 'trade_date')
+
+    def __init__(self, trade_id: str, price: float, quantity: float, trade_date: str):
+        self.trade_id = trade_id
+        self.price = price
+        self.quantity = quantity  # shares still open
+        self.trade_date = trade_date
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trade_id': self.trade_id,
+            'price': self.price,
+            'quantity': self.quantity,
+            'trade_date': self.trade_date
+        }
+
+
+class SymbolLots:
+    def __init__(self):
+        """
+        Open buy lots for one symbol
+
+        Lots sit in a deque in purchase order (FIFO from the left, LIFO from
+        the right) and in a max-heap by price for HIFO. Fully consumed lots
+        are dropped lazily when they reach the end being matched from, so
+        each lot is pushed and popped once and matching is amortized O(1)
+        per lot touched.
+        """
+        self.queue: Deque[OpenLot] = deque()
+        self.by_price: List[tuple] = []
+        self.by_id: Dict[str, OpenLot] = {}
+        self.open_quantity = 0.0
+        self.open_cost = 0.0
+        self._sequence = itertools.count()
+
+    def add(self, lot: OpenLot):
+        self.queue.append(lot)
+        heapq.heappush(self.by_price, (-lot.price, next(self._sequence), lot))
+        self.by_id[lot.trade_id] = lot
+        self.open_quantity += lot.quantity
+        self.open_cost += lot.price * lot.quantity
+
+    def _next_lot(self, method: str) -> Optional[OpenLot]:
+        if method == 'HIFO':
+            while self.by_price and self.by_price[0][2].quantity <= 0:
+                heapq.heappop(self.by_price)
+            return self.by_price[0][2] if self.by_price else None
+
+        if method == 'LIFO':
+            while self.queue and self.queue[-1].quantity <= 0:
+                self.queue.pop()
+            return self.queue[-1] if self.queue else None
+
+        while self.queue and self.queue[0].quantity <= 0:
+            self.queue.popleft()
+        return self.queue[0] if self.queue else None
+
+    def _take(self, lot: OpenLot, quantity: float) -> Dict[str, Any]:
+        lot.quantity -= quantity
+        self.open_quantity -= quantity
+        self.open_cost -= lot.price * quantity
+        if lot.quantity <= 0:
+            self.by_id.pop(lot.trade_id, None)
+        return {'trade_id': lot.trade_id, 'quantity': quantity, 'price': lot.price}
+
+    def consume(self, quantity: float, method: str = 'FIFO') -> List[Dict[str, Any]]:
+        """Close up to `quantity` shares using the given lot selection method"""
+        matches = []
+        remaining = quantity
+        while remaining > 0:
+            lot = self._next_lot(method)
+            if lot is None:
+                break
+            taken = min(lot.quantity, remaining)
+            matches.append(self._take(lot, taken))
+            remaining -= taken
+        return matches
+
+    def consume_matches(self, matches: List[Dict[str, Any]]):
+        """Re-apply lot matches recorded in the journal"""
+        for match in matches:
+            lot = self.by_id.get(match['trade_id'])
+            if lot is not None:
+                self._take(lot, min(lot.quantity, match['quantity']))
+
+    def open_lots(self) -> List[OpenLot]:
+        """Open lots in purchase order"""
+        return [lot for lot in self.queue if lot.quantity > 0]
+
+    def average_price(self) -> float:
+        """Cost per share of the shares still open"""
+        return self.open_cost / self.open_quantity if self.open_quantity > 0 else 0.0
+
+
+class LotBook:
+    def __init__(self):
+        """Open lots per symbol for one account, maintained as trades are recorded"""
+        self.symbols: Dict[str, SymbolLots] = {}
+
+    @classmethod
+    def from_trades(cls, trades: List[Dict[str, Any]]) -> "LotBook":
+        """Rebuild the open lots by replaying a trade history"""
+        book = cls()
+        for trade in trades:
+            book.apply_trade(trade)
+        return book
+
+    def apply_trade(self, trade: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Update open lots for one trade
+
+        Buys open a lot. Sells replay their recorded `lot_matches` when
+        present; otherwise lots are matched with the trade's `lot_method`
+        (FIFO by default).
+
+        Returns:
+            The lot matches for a sell, None for a buy
+        """
+        symbol = trade.get('symbol', trade.get('ticker', ''))
+        side = trade.get('side', trade.get('action', '').upper())
+        lots = self.symbols.get(symbol)
+
+        if side == 'BUY':
+            if lots is None:
+                lots = self.symbols[symbol] = SymbolLots()
+            lots.add(OpenLot(
+                trade.get('trade_id', ''),
+                trade.get('price', 0),
+                trade.get('quantity', 0),
+                trade.get('trade_date', '')
+            ))
+            return None
+
+        if lots is None:
+            return []
+
+        if 'lot_matches' in trade:
+            matches = trade['lot_matches']
+            lots.consume_matches(matches)
+        else:
+            matches = lots.consume(trade.get('quantity', 0), trade.get('lot_method', 'FIFO'))
+
+        if lots.open_quantity <= 0:
+            del self.symbols[symbol]
+        return matches
+
+    def cost_basis(self, symbol: str) -> Optional[Dict[str, float]]:
+        """Open quantity, cost and average price for a symbol, or None if nothing is open"""
+        lots = self.symbols.get(symbol)
+        if lots is None:
+            return None
+        return {
+            'quantity': lots.open_quantity,
+            'cost_basis': lots.open_cost,
+            'avg_price': lots.average_price()
+        }
+
+    def open_lots(self, symbol: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        symbols = [symbol] if symbol else sorted(self.symbols)
+        return {
+            s: [lot.to_dict() for lot in self.symbols[s].open_lots()]
+            for s in symbols if s in self.symbols
+        }
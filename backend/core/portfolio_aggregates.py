@@ -0,0 +1,123 @@
+from typing import Any, Dict, List
+
+from core.trade_index import trade_date, trade_side, trade_symbol
+
+
+def _empty_rollup() -> Dict[str, float]:
+    return {
+        'trade_count': 0,
+        'buy_quantity': 0,
+        'sell_quantity': 0,
+        'total_cash_spent': 0.0,
+        'total_cash_received': 0.0,
+        'total_realized_pnl': 0.0,
+        'total_commission': 0.0
+    }
+
+
+def _sum_rollup(trades: List[Dict[str, Any]]) -> Dict[str, float]:
+    """One rollup computed with plain sums over a group of trades"""
+    buys = [t for t in trades if trade_side(t) == 'BUY']
+    sells = [t for t in trades if trade_side(t) == 'SELL']
+    return {
+        'trade_count': len(trades),
+        'buy_quantity': sum(t.get('quantity', 0) for t in buys),
+        'sell_quantity': sum(t.get('quantity', 0) for t in sells),
+        'total_cash_spent': sum(t.get('net_value', 0) for t in buys),
+        'total_cash_received': sum(t.get('net_value', 0) for t in sells),
+        'total_realized_pnl': sum(t.get('realized_pnl', 0) for t in trades),
+        'total_commission': sum(t.get('commission') or 0 for t in trades)
+    }
+
+
+class PortfolioAggregates:
+    def __init__(self):
+        """
+        Running totals over one account's trade history
+
+        Updated once per recorded trade, so /stats never re-scans the
+        history. Kept as overall totals plus per-symbol and per-day rollups
+        with the same fields.
+        """
+        self.totals = _empty_rollup()
+        self.by_symbol: Dict[str, Dict[str, float]] = {}
+        self.by_day: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_trades(cls, trades: List[Dict[str, Any]]) -> "PortfolioAggregates":
+        aggregates = cls()
+        for trade in trades:
+            aggregates.add(trade)
+        return aggregates
+
+    @classmethod
+    def reference(cls, trades: List[Dict[str, Any]]) -> "PortfolioAggregates":
+        """Recompute from scratch by grouping and summing, independently of add(), to check it"""
+        by_symbol: Dict[str, List[Dict[str, Any]]] = {}
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for trade in trades:
+            by_symbol.setdefault(trade_symbol(trade), []).append(trade)
+            by_day.setdefault(trade_date(trade), []).append(trade)
+
+        aggregates = cls()
+        aggregates.totals = _sum_rollup(trades)
+        aggregates.by_symbol = {symbol: _sum_rollup(group) for symbol, group in by_symbol.items()}
+        aggregates.by_day = {day: _sum_rollup(group) for day, group in by_day.items()}
+        return aggregates
+
+    def copy(self) -> "PortfolioAggregates":
+        """Point-in-time copy that later add() calls don't affect"""
+        aggregates = PortfolioAggregates()
+        aggregates.totals = dict(self.totals)
+        aggregates.by_symbol = {key: dict(rollup) for key, rollup in self.by_symbol.items()}
+        aggregates.by_day = {key: dict(rollup) for key, rollup in self.by_day.items()}
+        return aggregates
+
+    def add(self, trade: Dict[str, Any]):
+        """Fold one trade into the totals and its symbol and day rollups"""
+        side = trade_side(trade)
+        symbol_rollup = self.by_symbol.get(trade_symbol(trade))
+        if symbol_rollup is None:
+            symbol_rollup = self.by_symbol[trade_symbol(trade)] = _empty_rollup()
+        day_rollup = self.by_day.get(trade_date(trade))
+        if day_rollup is None:
+            day_rollup = self.by_day[trade_date(trade)] = _empty_rollup()
+
+        quantity = trade.get('quantity', 0)
+        net_value = trade.get('net_value', 0)
+        realized_pnl = trade.get('realized_pnl', 0)
+        commission = trade.get('commission') or 0
+
+        for rollup in (self.totals, symbol_rollup, day_rollup):
+            rollup['trade_count'] += 1
+            rollup['total_realized_pnl'] += realized_pnl
+            rollup['total_commission'] += commission
+            if side == 'BUY':
+                rollup['buy_quantity'] += quantity
+                rollup['total_cash_spent'] += net_value
+            elif side == 'SELL':
+                rollup['sell_quantity'] += quantity
+                rollup['total_cash_received'] += net_value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'totals': self.totals,
+            'by_symbol': self.by_symbol,
+            'by_day': self.by_day
+        }
+
+    def diff(self, other: "PortfolioAggregates", tolerance: float = 1e-6) -> List[str]:
+        """Describe every figure that differs from another set of aggregates"""
+        mismatches = []
+        for name, mine, theirs in (
+            ('totals', {'all': self.totals}, {'all': other.totals}),
+            ('symbol', self.by_symbol, other.by_symbol),
+            ('day', self.by_day, other.by_day),
+        ):
+            for key in sorted(set(mine) | set(theirs)):
+                a = mine.get(key, _empty_rollup())
+                b = theirs.get(key, _empty_rollup())
+                for field in a:
+                    if abs(a[field] - b[field]) > tolerance:
+                        mismatches.append(f"{name} {key} {field}: {a[field]} != {b[field]}")
+        return mismatches
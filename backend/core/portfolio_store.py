@@ -0,0 +1,477 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from core.lot_book import LotBook
+from core.trade_index import TradeHistoryIndex
+from core.portfolio_aggregates import PortfolioAggregates
+
+
+class JournalWriteError(Exception):
+    """A journal write failed: the record is applied in memory and will be retried, but isn't durable yet"""
+
+
+def check_aggregates(portfolios: Dict[str, Dict[str, Any]],
+                     aggregates: Dict[str, PortfolioAggregates]) -> Dict[str, List[str]]:
+    """
+    Compare maintained aggregates with an independent recomputation from each account's trades
+
+    Returns:
+        Mismatch descriptions per account (accounts without mismatches are omitted)
+    """
+    mismatches = {}
+    for uid, portfolio in portfolios.items():
+        reference = PortfolioAggregates.reference(portfolio.get('trades', []))
+        diff = aggregates.get(uid, PortfolioAggregates()).diff(reference)
+        if diff:
+            mismatches[uid] = diff
+    return mismatches
+
+
+class PortfolioStore:
+    def __init__(self, snapshot_file: str = "portfolios.json",
+                 journal_file: str = "portfolio_journal.ndjson",
+                 compact_every: int = 10000, commit_interval: float = 0.005,
+                 max_retry_interval: float = 30.0):
+        """
+        Portfolio persistence as a snapshot plus an append-only journal
+
+        Each mutation is applied in memory and queued as one compact JSON
+        line, so a trade costs O(1) I/O however large the book is. A single
+        background writer group-commits the queue every `commit_interval`
+        (one write and one fsync for every trade of every user in that
+        window); callers await `wait_committed` for durability. The snapshot
+        (same {uid: portfolio} layout as before) is rewritten only every
+        `compact_every` journal records, by the writer task off the event loop;
+        startup loads it and replays the tail.
+
+        Args:
+            snapshot_file: Compacted snapshot of all portfolios
+            journal_file: Append-only journal of mutations since the snapshot
+            compact_every: Journal records between snapshot compactions
+            commit_interval: Seconds the writer gathers records before each group commit
+            max_retry_interval: Longest backoff between retries of a failed journal write
+        """
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.compact_every = compact_every
+        self.commit_interval = commit_interval
+        self.max_retry_interval = max_retry_interval
+
+        self.portfolios: Dict[str, Dict[str, Any]] = {}
+        # Open lots per account, derived from the trade history and kept in step with it
+        self.lot_books: Dict[str, LotBook] = {}
+        # Per account: trade id, sell, symbol and date indexes over the trade list
+        self.trade_indexes: Dict[str, TradeHistoryIndex] = {}
+        # Per account: running totals and per-symbol / per-day rollups
+        self.aggregates: Dict[str, PortfolioAggregates] = {}
+        # Per account: journal seq of the last change, for caches derived from a portfolio
+        self.versions: Dict[str, int] = {}
+        self.seq = 0
+        self.committed_seq = 0
+        self.journal_records = 0
+        self.group_commits = 0
+        self.write_failures = 0
+        # Result of the last check of the live aggregates (run at each background compaction)
+        self.aggregate_mismatches: Dict[str, List[str]] = {}
+        self.aggregates_checked_seq = 0
+
+        # Serialises read-modify-write of one account's portfolio
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Journal lines applied in memory but not yet written, and callers awaiting them
+        self._pending: List[str] = []
+        self._commit_waiters: List[tuple] = []
+        self._writer: Optional[asyncio.Task] = None
+
+        self._load()
+        self._journal = open(self.journal_file, 'a', encoding='utf-8')
+
+    def _load(self):
+        """Load the snapshot and replay journal records written after it"""
+        snapshot_seq = 0
+        try:
+            if os.path.exists(self.snapshot_file):
+                with open(self.snapshot_file, 'r') as f:
+                    self.portfolios = json.load(f)
+        except Exception as e:
+            print(f"Error loading portfolios: {e}")
+            self.portfolios = {}
+
+        for uid, portfolio in self.portfolios.items():
+            self.versions[uid] = portfolio.pop('journal_seq', 0)
+            snapshot_seq = max(snapshot_seq, self.versions[uid])
+            self._rebuild_indexes(uid, portfolio)
+        self.seq = self.committed_seq = snapshot_seq
+
+        if not os.path.exists(self.journal_file):
+            return
+
+        replayed = 0
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    print("Skipping unreadable portfolio journal record")
+                    continue
+                self.journal_records += 1
+                if record['seq'] <= snapshot_seq:
+                    continue
+                self._apply(record)
+                self.seq = self.committed_seq = record['seq']
+                replayed += 1
+
+        if replayed:
+            print(f"Replayed {replayed} portfolio journal records")
+
+    def _apply(self, record: Dict[str, Any]):
+        """Apply one journal record to the in-memory portfolios"""
+        uid = record['uid']
+        self.versions[uid] = record['seq']
+        if record['op'] == 'put':
+            self.portfolios[uid] = record['portfolio']
+            self._rebuild_indexes(uid, record['portfolio'])
+            return
+
+        portfolio = self.portfolios[uid]
+        if record['op'] in ('trade', 'import'):
+            # An import is one record so a whole batch commits (or replays) atomically
+            trades = [record['trade']] if record['op'] == 'trade' else record['trades']
+            for trade in trades:
+                self._apply_lots(uid, trade)
+                portfolio['trades'].append(trade)
+                self.trade_indexes[uid].add(len(portfolio['trades']) - 1, trade)
+                self.aggregates[uid].add(trade)
+            portfolio['cash'] = record['cash']
+            for ticker, position in record['positions'].items():
+                if position is None:
+                    portfolio['positions'].pop(ticker, None)
+                else:
+                    self._apply_lot_cost(uid, ticker, position)
+                    portfolio['positions'][ticker] = position
+            portfolio['updated_at'] = record['updated_at']
+
+    def _rebuild_indexes(self, uid: str, portfolio: Dict[str, Any]):
+        """Derive the lot book and trade indexes from a whole portfolio"""
+        trades = portfolio.setdefault('trades', [])
+        self.lot_books[uid] = LotBook.from_trades(trades)
+        self.trade_indexes[uid] = TradeHistoryIndex(trades)
+        self.aggregates[uid] = PortfolioAggregates.from_trades(trades)
+
+    def _apply_lots(self, uid: str, trade: Dict[str, Any]):
+        """Match a trade against the open lots, annotating new sells with the lots they closed"""
+        book = self.lot_books.setdefault(uid, LotBook())
+        if trade.get('side') != 'SELL' or 'lot_matches' in trade:
+            # Buys, and sells replayed from the journal with their matches already recorded
+            book.apply_trade(trade)
+            return
+
+        matches = book.apply_trade(trade)
+        trade['lot_matches'] = matches
+        trade['matched_trade_ids'] = [match['trade_id'] for match in matches]
+        # Lot-based P&L when the lots cover the sale; otherwise keep the caller's average-cost figure
+        if sum(match['quantity'] for match in matches) == trade['quantity']:
+            trade['realized_pnl'] = sum((trade['price'] - match['price']) * match['quantity'] for match in matches)
+
+    def _apply_lot_cost(self, uid: str, ticker: str, position: Dict[str, Any]):
+        """
+        Set a position's avg_price from its open lots, so the cost basis left after
+        lot-matched sells agrees with the lot-based realized P&L
+
+        Positions whose history doesn't account for every share (e.g. created before
+        trades were recorded) keep the caller's average cost.
+        """
+        basis = self.get_lots(uid).cost_basis(ticker)
+        if basis is not None and abs(basis['quantity'] - position['quantity']) < 1e-9:
+            position['avg_price'] = basis['avg_price']
+
+    def _append(self, record: Dict[str, Any]) -> int:
+        """Apply a record and queue it for the next group commit; returns its journal seq"""
+        self.seq += 1
+        record['seq'] = self.seq
+        self._apply(record)
+        self._pending.append(json.dumps(record, separators=(',', ':')) + "\n")
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, startup): commit immediately
+            self.sync()
+            return record['seq']
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._run_writer())
+        return record['seq']
+
+    def _write_lines(self, lines: List[str]):
+        self._journal.write("".join(lines))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _committed(self, seq: int, lines: int):
+        self.committed_seq = seq
+        self.journal_records += lines
+        self.group_commits += 1
+
+        waiting = []
+        for waiter_seq, future in self._commit_waiters:
+            if waiter_seq <= seq:
+                if not future.done():
+                    future.set_result(None)
+            else:
+                waiting.append((waiter_seq, future))
+        self._commit_waiters = waiting
+
+    async def _run_writer(self):
+        """Group-commit queued journal lines until the queue stays empty"""
+        loop = asyncio.get_running_loop()
+        failures = 0
+        while True:
+            # Back off exponentially while writes keep failing
+            delay = self.commit_interval * 2 ** failures if failures else self.commit_interval
+            await asyncio.sleep(min(delay, self.max_retry_interval))
+            if not self._pending:
+                return
+
+            lines, self._pending = self._pending, []
+            seq = self.seq
+            try:
+                await loop.run_in_executor(None, self._write_lines, lines)
+            except Exception as e:
+                failures += 1
+                self.write_failures += 1
+                print(f"Error writing portfolio journal (attempt {failures}): {e}")
+                # The records stay applied in memory and are retried with the next batch.
+                # Only callers waiting on this batch are told it isn't durable yet.
+                self._pending = lines + self._pending
+                self._fail_waiters(seq, JournalWriteError(str(e)))
+                continue
+
+            failures = 0
+            self._committed(seq, len(lines))
+            if self.journal_records >= self.compact_every:
+                # The writer is the only journal writer, so nothing is appended mid-compaction
+                await self._compact_async()
+
+    def _fail_waiters(self, seq: int, error: Exception):
+        """Fail callers waiting on records up to `seq`, leaving later waiters queued"""
+        waiting = []
+        for waiter_seq, future in self._commit_waiters:
+            if waiter_seq <= seq:
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                waiting.append((waiter_seq, future))
+        self._commit_waiters = waiting
+
+    async def wait_committed(self, seq: Optional[int] = None):
+        """
+        Wait until the journal is durable up to `seq` (default: everything applied so far)
+
+        Raises:
+            JournalWriteError: If the write covering `seq` failed; the records stay
+                applied in memory and the writer keeps retrying them
+        """
+        seq = self.seq if seq is None else seq
+        if seq <= self.committed_seq:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._commit_waiters.append((seq, future))
+        await future
+
+    def lock(self, uid: str) -> asyncio.Lock:
+        """Per-account lock to hold across a portfolio read-modify-write"""
+        lock = self._locks.get(uid)
+        if lock is None:
+            lock = self._locks[uid] = asyncio.Lock()
+        return lock
+
+    def get(self, uid: str) -> Optional[Dict[str, Any]]:
+        return self.portfolios.get(uid)
+
+    def get_lots(self, uid: str) -> LotBook:
+        return self.lot_books.get(uid) or LotBook()
+
+    def get_trade_index(self, uid: str) -> TradeHistoryIndex:
+        return self.trade_indexes.get(uid) or TradeHistoryIndex([])
+
+    def get_aggregates(self, uid: str) -> PortfolioAggregates:
+        return self.aggregates.get(uid) or PortfolioAggregates()
+
+    def get_version(self, uid: str) -> int:
+        """Changes whenever the account's portfolio changes (0 for an unknown account)"""
+        return self.versions.get(uid, 0)
+
+    def verify_aggregates(self) -> Dict[str, List[str]]:
+        """Check every account's aggregates against an independent recomputation from its trades"""
+        return check_aggregates(self.portfolios, self.aggregates)
+
+    def put_portfolio(self, uid: str, portfolio: Dict[str, Any]) -> int:
+        """Create or replace a whole portfolio (new accounts and resets); returns the journal seq"""
+        return self._append({'op': 'put', 'uid': uid, 'portfolio': portfolio})
+
+    def record_trade(self, uid: str, trade: Dict[str, Any], cash: float,
+                     positions: Dict[str, Optional[Dict[str, Any]]]) -> int:
+        """
+        Record one executed trade
+
+        Sells are matched against the account's open lots using the trade's
+        `lot_method`; `lot_matches`, `matched_trade_ids` and `realized_pnl`
+        are filled in on the trade record, and the changed positions take their
+        avg_price from the lots left open.
+
+        Args:
+            uid: Account id
+            trade: Trade record to append to the history
+            cash: Cash balance after the trade
+            positions: Positions changed by the trade (None = position closed)
+
+        Returns:
+            Journal seq of the record, for wait_committed
+        """
+        return self._append({
+            'op': 'trade',
+            'uid': uid,
+            'trade': trade,
+            'cash': cash,
+            'positions': positions,
+            'updated_at': datetime.now().isoformat()
+        })
+
+    def record_import(self, uid: str, trades: List[Dict[str, Any]], cash: float,
+                      positions: Dict[str, Optional[Dict[str, Any]]]) -> int:
+        """
+        Record a batch of imported trades as one journal record
+
+        Args:
+            uid: Account id
+            trades: Trade records in execution order; sells may carry precomputed `lot_matches`
+            cash: Cash balance after the batch
+            positions: Positions changed by the batch (None = position closed)
+
+        Returns:
+            Journal seq of the record, for wait_committed
+        """
+        return self._append({
+            'op': 'import',
+            'uid': uid,
+            'trades': trades,
+            'cash': cash,
+            'positions': positions,
+            'updated_at': datetime.now().isoformat()
+        })
+
+    def sync(self):
+        """Write and fsync queued journal lines immediately"""
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        self._write_lines(lines)
+        self._committed(self.seq, len(lines))
+        if self.journal_records >= self.compact_every:
+            self.compact()
+
+    def _capture_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Point-in-time copy of every portfolio at the current journal seq
+
+        Trade records are never modified once appended and positions are replaced
+        rather than mutated, so copying the containers (not the records) is enough
+        for another thread to serialise the result while trading continues.
+        """
+        return {
+            uid: {
+                **portfolio,
+                'positions': dict(portfolio.get('positions', {})),
+                'trades': list(portfolio.get('trades', [])),
+                'journal_seq': self.seq
+            }
+            for uid, portfolio in self.portfolios.items()
+        }
+
+    def _write_snapshot(self, snapshot: Dict[str, Dict[str, Any]]) -> bool:
+        """Serialise and fsync a snapshot, replacing the previous one atomically"""
+        tmp_file = f"{self.snapshot_file}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                # One account at a time, so a writer thread yields between accounts
+                f.write('{')
+                for i, (uid, portfolio) in enumerate(snapshot.items()):
+                    f.write(f"{',' if i else ''}{json.dumps(uid)}:")
+                    f.write(json.dumps(portfolio, separators=(',', ':')))
+                f.write('}')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+            return True
+        except Exception as e:
+            print(f"Error saving portfolio snapshot: {e}")
+            return False
+
+    def _truncate_journal(self, seq: int):
+        # Records up to seq are now in the snapshot and skipped on replay even if truncation fails
+        self._journal.close()
+        self._journal = open(self.journal_file, 'w', encoding='utf-8')
+        self.journal_records = 0
+        print(f"Portfolio snapshot written at journal seq {seq}")
+
+    def compact(self):
+        """Write a fresh snapshot and truncate the journal (blocking; for startup, scripts and shutdown)"""
+        seq = self.seq
+        if self._write_snapshot(self._capture_snapshot()):
+            self._truncate_journal(seq)
+
+    async def _compact_async(self):
+        """Compact with serialisation and fsync in a worker thread"""
+        seq = self.seq
+        snapshot = self._capture_snapshot()
+        aggregates = {uid: aggregates.copy() for uid, aggregates in self.aggregates.items()}
+        if await asyncio.to_thread(self._write_snapshot, snapshot):
+            self._truncate_journal(seq)
+
+        # The snapshot's trade lists and the aggregate copies are from the same instant,
+        # so this checks the incrementally updated aggregates of the running process
+        self.aggregate_mismatches = await asyncio.to_thread(check_aggregates, snapshot, aggregates)
+        self.aggregates_checked_seq = seq
+        for uid, diff in self.aggregate_mismatches.items():
+            print(f"Portfolio aggregates drifted for {uid}: {len(diff)} mismatches, e.g. {diff[0]}")
+
+    async def close(self):
+        """Flush the journal and compact on shutdown"""
+        if self._writer is not None:
+            await self._writer
+        self.sync()
+        self.compact()
+        self._journal.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'accounts': len(self.portfolios),
+            'journal_seq': self.seq,
+            'committed_seq': self.committed_seq,
+            'group_commits': self.group_commits,
+            'write_failures': self.write_failures,
+            'pending_records': len(self._pending),
+            'journal_records_since_snapshot': self.journal_records,
+            'aggregates_checked_seq': self.aggregates_checked_seq,
+            'accounts_with_aggregate_drift': sorted(self.aggregate_mismatches)
+        }
+
+
+# Global store instance
+portfolio_store = PortfolioStore()
+
+
+if __name__ == "__main__":
+    # Rebuild every portfolio from the snapshot and journal, then check the
+    # aggregates PortfolioAggregates.add() maintains against plain sums over
+    # each trade list (the running server checks its own at every compaction):
+    #   python -m core.portfolio_store
+    mismatches = portfolio_store.verify_aggregates()
+    for uid, diff in mismatches.items():
+        print(f"{uid}: {len(diff)} mismatched aggregates")
+        for line in diff:
+            print(f"  {line}")
+    print(f"Checked {len(portfolio_store.portfolios)} accounts, {len(mismatches)} with mismatches")
+    raise SystemExit(1 if mismatches else 0)
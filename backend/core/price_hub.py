@@ -0,0 +1,343 @@
+import asyncio
+import itertools
+import json
+import math
+import os
+import time
+import websockets
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Called with (symbol, price, timestamp_ms, size) for every upstream trade
+TradeListener = Callable[[str, float, int, float], None]
+# Called with a symbol once nothing streams it any more, so per-symbol state can be freed
+ReleaseListener = Callable[[str], None]
+
+
+class PriceSubscriber:
+    def __init__(self, subscriber_id: int, send: Callable[[Dict[str, Any]], Awaitable[None]], interval: float):
+        """
+        One downstream client of the hub
+
+        Args:
+            subscriber_id: Unique id assigned by the hub
+            send: Coroutine function delivering a JSON message to the client
+            interval: Conflation interval in seconds for this client
+        """
+        self.subscriber_id = subscriber_id
+        self.send = send
+        self.interval = interval
+        self.symbols: Set[str] = set()
+        # Last tick sequence delivered per symbol; only newer ticks are sent
+        self.last_seq: Dict[str, int] = {}
+
+
+class PriceStreamHub:
+    def __init__(self, api_key: Optional[str], conflation_interval: float = 1.0,
+                 max_symbols_per_client: int = 50, max_watched_symbols: int = 100,
+                 watch_ttl: float = 900.0):
+        """
+        Single upstream Finnhub WebSocket shared by every connected client
+
+        Subscriptions are reference-counted across clients, so each symbol is
+        subscribed upstream once. Trades are conflated per symbol: each client
+        receives at most one update per symbol per interval, carrying the
+        latest price and the volume streamed since the symbol was subscribed.
+
+        Args:
+            api_key: Finnhub API key
+            conflation_interval: Default seconds between updates to a client
+            max_symbols_per_client: Most symbols one downstream client may subscribe to
+            max_watched_symbols: Most symbols tracked server-side without a client
+            watch_ttl: Seconds a server-side watch lasts after it was last renewed
+        """
+        self.api_key = api_key
+        self.url = f"wss://ws.finnhub.io?token={api_key}"
+        self.conflation_interval = conflation_interval
+        self.min_interval = 0.5
+        self.max_interval = 60.0
+        self.max_symbols_per_client = max_symbols_per_client
+        self.max_watched_symbols = max_watched_symbols
+        self.watch_ttl = watch_ttl
+
+        self._ids = itertools.count(1)
+        self._subscribers: Dict[int, PriceSubscriber] = {}
+        self._symbol_refs: Dict[str, int] = {}
+        # symbol -> (sequence, tick); sequence increases on every trade
+        self._latest: Dict[str, tuple] = {}
+        self._volume: Dict[str, float] = {}
+        self._seq = itertools.count(1)
+        self._listeners: List[TradeListener] = []
+        self._release_listeners: List[ReleaseListener] = []
+
+        # Server-side subscriber for symbols tracked without a connected client;
+        # each watch expires watch_ttl seconds after it was last renewed
+        self._internal = PriceSubscriber(0, None, conflation_interval)
+        self._watch_expiry: Dict[str, float] = {}
+        self._expiry_task: Optional[asyncio.Task] = None
+
+        self._socket = None
+        self._upstream_task: Optional[asyncio.Task] = None
+        self._sender_tasks: Dict[int, asyncio.Task] = {}
+        self.upstream_messages = 0
+
+    def add_listener(self, listener: TradeListener):
+        """Register a callback invoked for every raw upstream trade"""
+        self._listeners.append(listener)
+
+    def add_release_listener(self, listener: ReleaseListener):
+        """Register a callback invoked when a symbol is unsubscribed upstream"""
+        self._release_listeners.append(listener)
+
+    async def watch(self, symbols: List[str]) -> List[str]:
+        """
+        Keep symbols streaming for in-process listeners (e.g. bar aggregation)
+
+        Watching an already watched symbol renews it. Watches lapse watch_ttl seconds
+        after their last renewal, and at most max_watched_symbols are held at once.
+
+        Returns:
+            Symbols refused because the watch limit was reached
+        """
+        await self._expire_watches()
+
+        deadline = time.monotonic() + self.watch_ttl
+        accepted, rejected = [], []
+        for symbol in sorted({s.upper() for s in symbols if s}):
+            if symbol in self._watch_expiry or len(self._watch_expiry) < self.max_watched_symbols:
+                self._watch_expiry[symbol] = deadline
+                accepted.append(symbol)
+            else:
+                rejected.append(symbol)
+
+        await self.subscribe(self._internal, accepted)
+        if self._watch_expiry and (self._expiry_task is None or self._expiry_task.done()):
+            self._expiry_task = asyncio.ensure_future(self._run_watch_expiry())
+        return rejected
+
+    async def unwatch(self, symbols: List[str]):
+        """Stop tracking symbols server-side"""
+        symbols = [s.upper() for s in symbols if s]
+        for symbol in symbols:
+            self._watch_expiry.pop(symbol, None)
+        await self.unsubscribe(self._internal, symbols)
+
+    async def _expire_watches(self):
+        now = time.monotonic()
+        expired = [symbol for symbol, deadline in self._watch_expiry.items() if deadline <= now]
+        if expired:
+            await self.unwatch(expired)
+
+    async def _run_watch_expiry(self):
+        """Drop lapsed watches periodically; exits once nothing is watched"""
+        try:
+            while self._watch_expiry:
+                await asyncio.sleep(min(60.0, self.watch_ttl))
+                await self._expire_watches()
+        except asyncio.CancelledError:
+            pass
+
+    def is_streaming(self, symbol: str) -> bool:
+        return self._socket is not None and symbol.upper() in self._symbol_refs
+
+    def connect(self, send: Callable[[Dict[str, Any]], Awaitable[None]],
+                interval: Optional[float] = None) -> PriceSubscriber:
+        """Register a downstream client and start its conflating sender"""
+        if not interval or not math.isfinite(interval):
+            interval = self.conflation_interval
+        interval = min(self.max_interval, max(self.min_interval, interval))
+        subscriber = PriceSubscriber(next(self._ids), send, interval)
+        self._subscribers[subscriber.subscriber_id] = subscriber
+        self._sender_tasks[subscriber.subscriber_id] = asyncio.ensure_future(self._sender(subscriber))
+        return subscriber
+
+    async def disconnect(self, subscriber: PriceSubscriber):
+        """Remove a client and release its symbol subscriptions"""
+        await self.unsubscribe(subscriber, list(subscriber.symbols))
+        self._subscribers.pop(subscriber.subscriber_id, None)
+        task = self._sender_tasks.pop(subscriber.subscriber_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def subscribe(self, subscriber: PriceSubscriber, symbols: List[str]) -> List[str]:
+        """
+        Subscribe a client to symbols, subscribing upstream on first use
+
+        Returns:
+            Symbols refused because the client is at max_symbols_per_client
+        """
+        rejected = []
+        for symbol in sorted({s.upper() for s in symbols if s}):
+            if symbol in subscriber.symbols:
+                continue
+            if subscriber is not self._internal and len(subscriber.symbols) >= self.max_symbols_per_client:
+                rejected.append(symbol)
+                continue
+            subscriber.symbols.add(symbol)
+            # Don't replay ticks that arrived before this client subscribed
+            subscriber.last_seq[symbol] = self._latest.get(symbol, (0, None))[0]
+
+            self._symbol_refs[symbol] = self._symbol_refs.get(symbol, 0) + 1
+            if self._symbol_refs[symbol] == 1:
+                await self._send_upstream({'type': 'subscribe', 'symbol': symbol})
+
+        self._ensure_upstream()
+        return rejected
+
+    async def unsubscribe(self, subscriber: PriceSubscriber, symbols: List[str]):
+        """Unsubscribe a client, unsubscribing upstream when no client needs a symbol"""
+        for symbol in {s.upper() for s in symbols if s}:
+            if symbol not in subscriber.symbols:
+                continue
+            subscriber.symbols.discard(symbol)
+            subscriber.last_seq.pop(symbol, None)
+
+            self._symbol_refs[symbol] -= 1
+            if self._symbol_refs[symbol] == 0:
+                del self._symbol_refs[symbol]
+                self._latest.pop(symbol, None)
+                self._volume.pop(symbol, None)
+                await self._send_upstream({'type': 'unsubscribe', 'symbol': symbol})
+                for listener in self._release_listeners:
+                    try:
+                        listener(symbol)
+                    except Exception as e:
+                        print(f"Price hub: release listener error: {e}")
+
+        # Nobody needs the upstream connection any more; _run_upstream exits once it closes
+        if not self._symbol_refs and self._socket is not None:
+            await self._socket.close()
+
+    async def _sender(self, subscriber: PriceSubscriber):
+        """Every interval, send the client the latest tick for symbols that changed"""
+        try:
+            while True:
+                await asyncio.sleep(subscriber.interval)
+
+                updates = []
+                for symbol in subscriber.symbols:
+                    entry = self._latest.get(symbol)
+                    if entry is None or entry[0] <= subscriber.last_seq.get(symbol, 0):
+                        continue
+                    subscriber.last_seq[symbol] = entry[0]
+                    updates.append(entry[1])
+
+                if updates:
+                    await subscriber.send({'type': 'trades', 'data': updates})
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Price hub: dropping subscriber {subscriber.subscriber_id}: {e}")
+            await self.disconnect(subscriber)
+
+    def _ensure_upstream(self):
+        if not self.api_key:
+            return
+        if self._upstream_task is None or self._upstream_task.done():
+            self._upstream_task = asyncio.ensure_future(self._run_upstream())
+
+    async def _send_upstream(self, message: Dict[str, Any]):
+        if self._socket is None:
+            # Sent on (re)connect from _symbol_refs
+            return
+        try:
+            await self._socket.send(json.dumps(message))
+        except Exception as e:
+            print(f"Price hub: upstream send failed: {e}")
+
+    async def _run_upstream(self):
+        """Hold the upstream connection open, reconnecting with backoff while anyone is subscribed"""
+        backoff = 1
+        while self._symbol_refs:
+            try:
+                async with websockets.connect(self.url, ping_interval=20) as socket:
+                    self._socket = socket
+                    backoff = 1
+                    print(f"Price hub: connected upstream, {len(self._symbol_refs)} symbols")
+                    for symbol in list(self._symbol_refs):
+                        await socket.send(json.dumps({'type': 'subscribe', 'symbol': symbol}))
+
+                    async for message in socket:
+                        self._handle_upstream_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Price hub: upstream error: {e}; reconnecting in {backoff}s")
+            finally:
+                self._socket = None
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def _handle_upstream_message(self, message: str):
+        self.upstream_messages += 1
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+
+        if data.get('type') != 'trade':
+            return
+
+        for trade in data.get('data') or []:
+            symbol = trade.get('s')
+            price = trade.get('p')
+            if symbol is None or price is None:
+                continue
+            ts = trade.get('t', 0)
+            size = trade.get('v', 0) or 0
+
+            volume = self._volume.get(symbol, 0) + size
+            self._volume[symbol] = volume
+            self._latest[symbol] = (next(self._seq), {
+                'symbol': symbol,
+                'price': price,
+                'ts': ts,
+                'size': size,
+                'volume': volume
+            })
+
+            for listener in self._listeners:
+                try:
+                    listener(symbol, price, ts, size)
+                except Exception as e:
+                    print(f"Price hub: listener error: {e}")
+
+    async def close(self):
+        """Stop the upstream connection and all client senders"""
+        for task in self._sender_tasks.values():
+            task.cancel()
+        self._sender_tasks.clear()
+        self._symbol_refs.clear()
+        self._watch_expiry.clear()
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+        if self._upstream_task is not None:
+            self._upstream_task.cancel()
+            try:
+                await self._upstream_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._upstream_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'connected': self._socket is not None,
+            'clients': len(self._subscribers),
+            'symbols': sorted(self._symbol_refs),
+            'watched_symbols': sorted(self._internal.symbols),
+            'upstream_messages': self.upstream_messages
+        }
+
+
+# Global hub instance
+price_hub = PriceStreamHub(
+    api_key=os.getenv("FINNHUB_API_KEY"),
+    conflation_interval=float(os.getenv("PRICE_CONFLATION_SECONDS", "1.0")),
+    max_symbols_per_client=int(os.getenv("PRICE_STREAM_MAX_SYMBOLS", "50")),
+    max_watched_symbols=int(os.getenv("PRICE_HUB_MAX_WATCHED", "100")),
+    watch_ttl=float(os.getenv("PRICE_HUB_WATCH_TTL_SECONDS", "900"))
+)
@@ -0,0 +1,100 @@
+import os
+import time
+from typing import Any, Dict, Optional
+
+
+class QuoteBook:
+    def __init__(self, stale_after_seconds: float = 60.0):
+        """
+        Latest quote per symbol, shared by everything in the process
+
+        Fed by Finnhub quote fetches and by streamed trades from the price
+        hub; read in O(1) by market orders and live-price lookups. Each entry
+        records when it was last updated so readers can tell how fresh it is.
+
+        Args:
+            stale_after_seconds: Age after which a quote counts as stale
+        """
+        self.stale_after_seconds = stale_after_seconds
+        self.quotes: Dict[str, Dict[str, Any]] = {}
+        self.updates = 0
+
+    def update_from_finnhub(self, symbol: str, quote_data: Dict[str, Any]):
+        """Store a Finnhub /quote response"""
+        price = quote_data.get('c')
+        if not price:
+            return
+        self.quotes[symbol.upper()] = {
+            'price': price,
+            'change': quote_data.get('d', 0),
+            'change_percent': quote_data.get('dp', 0),
+            'high': quote_data.get('h', 0),
+            'low': quote_data.get('l', 0),
+            'open': quote_data.get('o', 0),
+            'previous_close': quote_data.get('pc', 0),
+            # Reference fields (previous close, open) come from here, not the stream
+            'reference_fetched': True,
+            'updated_at': time.time(),
+            'source': 'quote'
+        }
+        self.updates += 1
+
+    def on_trade(self, symbol: str, price: float, ts_ms: int, size: float):
+        """Trade listener for the price hub: move the last price, keep the day's reference values"""
+        quote = self.quotes.get(symbol)
+        if quote is None:
+            quote = self.quotes[symbol] = {
+                'price': price, 'change': 0, 'change_percent': 0,
+                'high': price, 'low': price, 'open': price, 'previous_close': 0,
+                'reference_fetched': False
+            }
+
+        quote['price'] = price
+        if price > quote['high']:
+            quote['high'] = price
+        if price < quote['low'] or not quote['low']:
+            quote['low'] = price
+        previous_close = quote['previous_close']
+        if previous_close:
+            quote['change'] = round(price - previous_close, 4)
+            quote['change_percent'] = round((price - previous_close) / previous_close * 100, 4)
+        quote['updated_at'] = time.time()
+        quote['source'] = 'stream'
+        self.updates += 1
+
+    def get(self, symbol: str, max_age_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Latest quote with its age, or None if the symbol has never been quoted
+
+        Returns:
+            A copy of the entry plus `age_seconds` and `stale` (older than
+            `max_age_seconds`, default the book's threshold)
+        """
+        quote = self.quotes.get(symbol.upper())
+        if quote is None:
+            return None
+        max_age = self.stale_after_seconds if max_age_seconds is None else max_age_seconds
+        age = time.time() - quote['updated_at']
+        return {**quote, 'age_seconds': round(age, 3), 'stale': age > max_age}
+
+    def needs_refresh(self, quote: Optional[Dict[str, Any]]) -> bool:
+        """
+        Whether an entry from get() should be refreshed from Finnhub
+
+        True when it is missing or stale, or was first seen on the stream and so
+        lacks the previous close that change and day change are measured from.
+        """
+        return quote is None or quote['stale'] or not quote.get('reference_fetched', True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            'symbols': len(self.quotes),
+            'fresh': sum(1 for q in self.quotes.values() if now - q['updated_at'] <= self.stale_after_seconds),
+            'stale_after_seconds': self.stale_after_seconds,
+            'updates': self.updates
+        }
+
+
+# Global quote book instance
+quote_book = QuoteBook(stale_after_seconds=float(os.getenv("QUOTE_STALE_SECONDS", "60")))
@@ -0,0 +1,176 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+
+class QuotaExhausted(Exception):
+    """Raised when a provider's daily request cap has been used up"""
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate_per_minute: float, capacity: int, daily_cap: Optional[int] = None):
+        """
+        Async token bucket with a priority queue of waiters
+
+        Args:
+            name: Provider name used in logs and budget reports
+            rate_per_minute: Sustained request rate
+            capacity: Maximum burst size
+            daily_cap: Optional hard limit on requests per calendar day
+        """
+        self.name = name
+        self.rate_per_minute = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.daily_cap = daily_cap
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.day = date.today()
+        self.daily_used = 0
+        # Heap of (priority, sequence, future): FIFO within a priority level
+        self._waiters: List[tuple] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Loop the waiters and dispatcher belong to; sync facades run each call on a new loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _check_daily_cap(self):
+        today = date.today()
+        if today != self.day:
+            self.day = today
+            self.daily_used = 0
+        if self.daily_cap is not None and self.daily_used >= self.daily_cap:
+            raise QuotaExhausted(f"{self.name} daily quota of {self.daily_cap} requests exhausted")
+
+    def _grant(self):
+        self.tokens -= 1
+        self.daily_used += 1
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Wait until a request may be sent to this provider
+
+        Raises:
+            QuotaExhausted: If the daily cap has been reached
+        """
+        self._check_daily_cap()
+        self._refill()
+
+        # Fast path: nobody queued ahead of us and a token is available
+        if not self._waiters and self.tokens >= 1:
+            self._grant()
+            return
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Waiters and the dispatcher of a previous (finished) loop can never run again
+            self._loop = loop
+            self._waiters = []
+            self._dispatcher = None
+
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        await future
+
+    async def _dispatch(self):
+        """Hand out tokens to queued waiters in priority order as they refill"""
+        try:
+            while self._waiters:
+                # Skip waiters that were cancelled while queued
+                if self._waiters[0][2].done():
+                    heapq.heappop(self._waiters)
+                    continue
+
+                self._refill()
+                if self.tokens < 1:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                    continue
+
+                _, _, future = heapq.heappop(self._waiters)
+                try:
+                    self._check_daily_cap()
+                except QuotaExhausted as e:
+                    future.set_exception(e)
+                    continue
+
+                self._grant()
+                future.set_result(None)
+        finally:
+            # Also on cancellation (e.g. asyncio.run shutting its loop down)
+            if self._dispatcher is asyncio.current_task():
+                self._dispatcher = None
+
+    def get_budget(self) -> Dict[str, Any]:
+        """Report the remaining request budget"""
+        self._refill()
+        queued = sum(1 for _, _, future in self._waiters if not future.done())
+        return {
+            'tokens_available': round(self.tokens, 2),
+            'capacity': self.capacity,
+            'rate_per_minute': self.rate_per_minute,
+            'daily_cap': self.daily_cap,
+            'daily_used': self.daily_used,
+            'daily_remaining': self.daily_cap - self.daily_used if self.daily_cap is not None else None,
+            'interactive_queued': sum(1 for p, _, f in self._waiters if p == PRIORITY_INTERACTIVE and not f.done()),
+            'queued': queued
+        }
+
+
+class ProviderRateLimiter:
+    def __init__(self, buckets: Dict[str, TokenBucket]):
+        """Holds one token bucket per upstream provider"""
+        self.buckets = buckets
+
+    async def acquire(self, provider: str, priority: int = PRIORITY_INTERACTIVE):
+        """Wait for the provider's budget; providers without a bucket are unlimited"""
+        bucket = self.buckets.get(provider)
+        if bucket is not None:
+            await bucket.acquire(priority)
+
+    def get_budget(self) -> Dict[str, Dict[str, Any]]:
+        """Remaining budget for every provider"""
+        return {name: bucket.get_budget() for name, bucket in self.buckets.items()}
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def create_default_rate_limiter() -> ProviderRateLimiter:
+    """Build the limiter from provider quotas (free-tier defaults, overridable via env)"""
+    return ProviderRateLimiter({
+        'finnhub': TokenBucket(
+            'finnhub',
+            rate_per_minute=_env_int("FINNHUB_RATE_PER_MINUTE", 60),
+            capacity=_env_int("FINNHUB_BURST", 10)
+        ),
+        'alphavantage': TokenBucket(
+            'alphavantage',
+            rate_per_minute=_env_int("ALPHA_VANTAGE_RATE_PER_MINUTE", 5),
+            capacity=_env_int("ALPHA_VANTAGE_BURST", 1),
+            daily_cap=_env_int("ALPHA_VANTAGE_DAILY_CAP", 25)
+        ),
+        'newsapi': TokenBucket(
+            'newsapi',
+            rate_per_minute=_env_int("NEWS_API_RATE_PER_MINUTE", 30),
+            capacity=_env_int("NEWS_API_BURST", 5),
+            daily_cap=_env_int("NEWS_API_DAILY_CAP", 100)
+        ),
+    })
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Coalesces concurrent calls for the same key into one execution
+
+        The first caller for a key starts the coroutine; callers arriving while
+        it is still running await the same task and receive its result (or
+        exception) instead of running it again.
+        """
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn once per key among concurrent callers
+
+        Args:
+            key: Identifier shared by calls that should be coalesced
+            fn: Zero-argument coroutine function producing the result
+
+        Returns:
+            The result of the single execution of fn for this key
+        """
+        task = self._tasks.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shield so one cancelled waiter does not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Number of keys currently being fetched"""
+        return len(self._tasks)
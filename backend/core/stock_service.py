@@ -1,12 +1,16 @@
-import requests
-from newsapi import NewsApiClient
+import asyncio
+import httpx
 import os
 from dotenv import load_dotenv
 import pandas as pd
 from typing import Optional, Dict, Any, List
-from datetime import datetime, date
-import time
+from datetime import datetime, date, timedelta
 from .cache import StockDataCache
+from .history_store import HistoryStore, PriceHistory
+from .singleflight import SingleFlight
+from .http_client import http_client
+from .quote_book import quote_book
+from .rate_limiter import create_default_rate_limiter, QuotaExhausted, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
 
 load_dotenv()
 
@@ -17,12 +21,23 @@ class StockDataService:
         self.alpha_vantage_api_key = os.getenv("ALPHA_VANTAGE_API_KEY")
         self.finnhub_base_url = "https://finnhub.io/api/v1"
         self.alpha_vantage_base_url = "https://www.alphavantage.co/query"
-        self.last_request_time = 0
-        self.min_request_interval = 1  # 1 second between requests to be respectful
+        self.news_api_url = "https://newsapi.org/v2/everything"
+        self.http = http_client
+        
+        # One token bucket per provider, sized to its real quota
+        self.rate_limiter = create_default_rate_limiter()
         
         # Initialize cache
         self.cache = StockDataCache()
         
+        # Parsed daily bars per ticker, refreshed at most once a day
+        self.history_store = HistoryStore(os.path.join(self.cache.cache_dir, "history"))
+        self.history_max_age_hours = 24
+        self.history_compact_window_days = 140
+        
+        # Coalesce concurrent cache misses so each key has one upstream call in flight
+        self.inflight = SingleFlight()
+        
         if not self.news_api_key:
             print("Warning: NEWS_API_KEY not found in environment variables")
         if not self.finnhub_api_key:
@@ -32,17 +47,8 @@ class StockDataService:
             print("Warning: ALPHA_VANTAGE_API_KEY not found in environment variables")
             print("Get a free API key from: https://www.alphavantage.co/support/#api-key")
 
-    def _rate_limit_check(self):
-        """Rate limiting for Finnhub API - minimal delay to be respectful."""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last
-            print(f"Rate limiting: waiting {sleep_time:.1f} seconds...")
-            time.sleep(sleep_time)
-        self.last_request_time = time.time()
-
-    def _make_finnhub_request(self, endpoint: str, params: Dict[str, str] = None) -> Optional[Dict]:
+    async def _make_finnhub_request(self, endpoint: str, params: Dict[str, str] = None,
+                                    priority: int = PRIORITY_INTERACTIVE) -> Optional[Dict]:
         """Make a request to Finnhub API with rate limiting and caching."""
         if not self.finnhub_api_key:
             return None
@@ -56,34 +62,90 @@ class StockDataService:
             print(f"Using cached data for {endpoint}")
             return cached_data
         
-        self._rate_limit_check()
+        return await self.inflight.do(cache_key, lambda: self._fetch_finnhub(endpoint, params, cache_key, priority))
+
+    async def _fetch_finnhub(self, endpoint: str, params: Optional[Dict[str, str]], cache_key: str,
+                             priority: int, use_cache: bool = True) -> Optional[Dict]:
+        """Fetch a Finnhub endpoint and cache it. Runs once per in-flight cache key."""
+        # Another flight for this key may have completed between our cache check and now
+        cached_data = self.cache.get(cache_key) if use_cache else None
+        if cached_data:
+            return cached_data
         
-        if params is None:
-            params = {}
+        params = dict(params) if params else {}
         params['token'] = self.finnhub_api_key
         
         try:
+            await self.rate_limiter.acquire('finnhub', priority)
+            
             url = f"{self.finnhub_base_url}/{endpoint}"
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = await self.http.get_json('finnhub', url, params)
             
             # Cache the successful response (1 hour TTL for real-time data, 24 hours for company info)
             ttl_hours = 1 if 'quote' in endpoint else 24
-            self.cache.set(cache_key, data)
+            self.cache.set(cache_key, data, ttl=timedelta(hours=ttl_hours))
+            if endpoint == "quote":
+                quote_book.update_from_finnhub(params['symbol'], data)
             
             print(f"API call made to {endpoint} - cached for {ttl_hours} hours")
             return data
             
-        except requests.RequestException as e:
+        except QuotaExhausted as e:
+            print(f"Finnhub rate limit: {e}")
+            return None
+        except httpx.HTTPError as e:
             print(f"Error making request to Finnhub API: {e}")
             return None
         except Exception as e:
             print(f"Unexpected error: {e}")
             return None
 
-    def _make_alpha_vantage_request(self, params: Dict[str, str]) -> Optional[Dict]:
-        """Make a request to Alpha Vantage API with rate limiting and caching."""
+    async def get_live_quote(self, symbol: str, max_age_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Latest quote from the shared quote book, refreshed from Finnhub when missing, stale or
+        without a previous close (symbols first seen on the stream)
+        
+        Returns:
+            Quote book entry (with `age_seconds` and `stale`), or None if the symbol has never been quoted
+        """
+        symbol = symbol.upper()
+        quote = quote_book.get(symbol, max_age_seconds)
+        if not quote_book.needs_refresh(quote):
+            return quote
+        
+        if self.finnhub_api_key:
+            params = {"symbol": symbol}
+            cache_key = f"quote_{str(params)}"
+            await self.inflight.do(
+                f"live_{cache_key}",
+                lambda: self._fetch_finnhub("quote", params, cache_key, PRIORITY_INTERACTIVE, use_cache=False)
+            )
+        return quote_book.get(symbol, max_age_seconds)
+
+    async def get_live_quotes(self, symbols: List[str], wait_seconds: float = 5.0) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Quote book entries for many symbols, refreshing missing or stale ones concurrently.
+        
+        Refreshes still running after wait_seconds keep going in the background; those
+        symbols get their current (stale) entry, or None if they have never been quoted.
+        """
+        symbols = list(dict.fromkeys(s.upper() for s in symbols if s))
+        quotes = {symbol: quote_book.get(symbol) for symbol in symbols}
+        
+        refresh = [asyncio.ensure_future(self.get_live_quote(symbol))
+                   for symbol, quote in quotes.items() if quote_book.needs_refresh(quote)]
+        if refresh:
+            await asyncio.wait(refresh, timeout=wait_seconds)
+            quotes = {symbol: quote_book.get(symbol) for symbol in symbols}
+        return quotes
+
+    async def _make_alpha_vantage_request(self, params: Dict[str, str],
+                                          priority: int = PRIORITY_INTERACTIVE,
+                                          use_cache: bool = True) -> Optional[Dict]:
+        """Make a request to Alpha Vantage API with rate limiting and caching.
+        
+        Set use_cache=False for payloads the caller stores itself (e.g. daily history).
+        """
         if not self.alpha_vantage_api_key:
             print("Alpha Vantage API key not available")
             return None
@@ -92,19 +154,28 @@ class StockDataService:
         cache_key = f"alphavantage_{str(params)}"
         
         # Check cache first
-        cached_data = self.cache.get(cache_key)
+        cached_data = self.cache.get(cache_key) if use_cache else None
         if cached_data:
             print(f"Using cached Alpha Vantage data for {params.get('function', 'unknown')}")
             return cached_data
         
-        self._rate_limit_check()
+        return await self.inflight.do(cache_key, lambda: self._fetch_alpha_vantage(params, cache_key, priority, use_cache))
+
+    async def _fetch_alpha_vantage(self, params: Dict[str, str], cache_key: str, priority: int,
+                                   use_cache: bool) -> Optional[Dict]:
+        """Fetch an Alpha Vantage function and cache it. Runs once per in-flight cache key."""
+        # Another flight for this key may have completed between our cache check and now
+        cached_data = self.cache.get(cache_key) if use_cache else None
+        if cached_data:
+            return cached_data
         
+        params = dict(params)
         params['apikey'] = self.alpha_vantage_api_key
         
         try:
-            response = requests.get(self.alpha_vantage_base_url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            await self.rate_limiter.acquire('alphavantage', priority)
+            
+            data = await self.http.get_json('alphavantage', self.alpha_vantage_base_url, params)
             
             # Check for API errors
             if 'Error Message' in data:
@@ -118,26 +189,90 @@ class StockDataService:
                 return None
             
             # Cache the successful response (Alpha Vantage data changes less frequently)
-            self.cache.set(cache_key, data)
-            print(f"Alpha Vantage API call made for {params.get('function', 'unknown')} - cached")
+            if use_cache:
+                self.cache.set(cache_key, data)
+            print(f"Alpha Vantage API call made for {params.get('function', 'unknown')}")
             
             return data
             
-        except requests.RequestException as e:
+        except QuotaExhausted as e:
+            print(f"Alpha Vantage rate limit: {e}")
+            return None
+        except httpx.HTTPError as e:
             print(f"Error making request to Alpha Vantage API: {e}")
             return None
         except Exception as e:
             print(f"Unexpected Alpha Vantage error: {e}")
             return None
 
+    async def _get_daily_history(self, symbol: str) -> Optional[PriceHistory]:
+        """Get parsed daily bars for a ticker, refreshing from Alpha Vantage when stale."""
+        history = self.history_store.get(symbol)
+        if history is not None and history.is_fresh(self.history_max_age_hours * 3600):
+            return history
+        
+        fresh = await self.inflight.do(f"history_{symbol}", lambda: self._refresh_daily_history(symbol))
+        # Serve stale bars rather than nothing if the refresh failed
+        return fresh or history
+
+    async def _refresh_daily_history(self, symbol: str) -> Optional[PriceHistory]:
+        """
+        Refresh daily history, fetching only the recent window when bars are already stored.
+        
+        History pulls are bulky and at most daily, so they queue behind quote and overview
+        requests for the same Alpha Vantage budget.
+        """
+        stored = self.history_store.get(symbol)
+        
+        # The compact window holds the latest 100 trading days (~140 calendar days)
+        if stored is not None and len(stored):
+            if stored.days_since_last_bar() < self.history_compact_window_days:
+                recent = await self._fetch_daily_history(symbol, 'compact', PRIORITY_BACKGROUND)
+                if recent is not None and stored.covers_gap_to(recent):
+                    history = stored.merge(recent)
+                    self.history_store.put(symbol, history)
+                    print(f"Incremental history update for {symbol}: {len(history) - len(stored)} new bars")
+                    return history
+        
+        history = await self._fetch_daily_history(symbol, 'full', PRIORITY_BACKGROUND)
+        if history is not None:
+            self.history_store.put(symbol, history)
+        return history
+
+    async def _fetch_daily_history(self, symbol: str, outputsize: str, priority: int) -> Optional[PriceHistory]:
+        """Download and parse TIME_SERIES_DAILY ('compact' = last 100 bars, 'full' = all)."""
+        data = await self._make_alpha_vantage_request({
+            'function': 'TIME_SERIES_DAILY',
+            'symbol': symbol,
+            'outputsize': outputsize
+        }, priority=priority, use_cache=False)
+        
+        if not data or 'Time Series (Daily)' not in data:
+            return None
+        
+        return PriceHistory.from_alpha_vantage(data['Time Series (Daily)'])
+
+    async def _skip_request(self) -> None:
+        """Placeholder for an optional upstream call that is not needed."""
+        return None
+
     async def get_stock_data(self, ticker: str, start_date: str = None, end_date: str = None) -> Optional[Dict[str, Any]]:
         """Fetches comprehensive stock data using Finnhub for current data and Alpha Vantage for historical charts"""
         try:
-            # Get current quote from Finnhub
-            quote_data = self._make_finnhub_request(f"quote", {"symbol": ticker.upper()})
+            symbol = ticker.upper()
+            fetch_history = bool(self.alpha_vantage_api_key and start_date and end_date)
             
-            # Get company profile from Finnhub  
-            profile_data = self._make_finnhub_request(f"stock/profile2", {"symbol": ticker.upper()})
+            # Quote and profile from Finnhub, overview and daily history from Alpha Vantage,
+            # fetched concurrently (each still waits on its own provider's rate budget)
+            quote_data, profile_data, overview_data, history = await asyncio.gather(
+                self._make_finnhub_request("quote", {"symbol": symbol}),
+                self._make_finnhub_request("stock/profile2", {"symbol": symbol}),
+                self._make_alpha_vantage_request({
+                    'function': 'OVERVIEW',
+                    'symbol': symbol
+                }) if self.alpha_vantage_api_key else self._skip_request(),
+                self._get_daily_history(symbol) if fetch_history else self._skip_request()
+            )
             
             if not quote_data or quote_data.get('c') is None:
                 return {
@@ -151,15 +286,6 @@ class StockDataService:
             change = current_price - previous_close if current_price and previous_close else 0
             change_percent = (change / previous_close * 100) if previous_close else 0
             
-            # Get basic financial metrics from Alpha Vantage if available
-            overview_data = None
-            if self.alpha_vantage_api_key:
-                overview_params = {
-                    'function': 'OVERVIEW',
-                    'symbol': ticker.upper()
-                }
-                overview_data = self._make_alpha_vantage_request(overview_params)
-            
             # Prepare the base data structure that frontend expects
             stock_data = {
                 'ticker': ticker.upper(),
@@ -187,57 +313,18 @@ class StockDataService:
                 'logo': profile_data.get('logo') if profile_data else None,
             }
             
-            # Get historical data from Alpha Vantage for chart if dates provided
-            if self.alpha_vantage_api_key and start_date and end_date:
-                time_series_params = {
-                    'function': 'TIME_SERIES_DAILY',
-                    'symbol': ticker.upper(),
-                    'outputsize': 'full'
-                }
-                
-                historical_data = self._make_alpha_vantage_request(time_series_params)
-                
-                if historical_data and 'Time Series (Daily)' in historical_data:
-                    time_series = historical_data['Time Series (Daily)']
+            # Use historical data from Alpha Vantage for chart if dates provided
+            if fetch_history:
+                if history is not None:
+                    # Binary search on the sorted date column; the slice is a view, not a copy
+                    bars = history.slice(start_date, end_date)
                     
-                    # Filter data by date range
-                    filtered_data = {}
-                    for date_str, values in time_series.items():
-                        if start_date <= date_str <= end_date:
-                            filtered_data[date_str] = values
-                    
-                    if filtered_data:
-                        # Sort dates and extract price data for chart
-                        sorted_dates = sorted(filtered_data.keys())
-                        
-                        dates = []
-                        open_prices = []
-                        high_prices = []
-                        low_prices = []
-                        close_prices = []
-                        volumes = []
-                        
-                        for date_str in sorted_dates:
-                            values = filtered_data[date_str]
-                            dates.append(date_str)
-                            open_prices.append(float(values['1. open']))
-                            high_prices.append(float(values['2. high']))
-                            low_prices.append(float(values['3. low']))
-                            close_prices.append(float(values['4. close']))
-                            volumes.append(int(values['5. volume']))
-                        
+                    if len(bars):
                         # Add historical chart data
-                        stock_data.update({
-                            'dates': dates,
-                            'open_prices': open_prices,
-                            'high_prices': high_prices,
-                            'low_prices': low_prices,
-                            'close_prices': close_prices,
-                            'volumes': volumes,
-                            'has_historical_data': True
-                        })
+                        stock_data.update(PriceHistory.to_chart_data(bars))
+                        stock_data['has_historical_data'] = True
                         
-                        print(f"Retrieved {len(dates)} days of historical data for {ticker}")
+                        print(f"Retrieved {len(bars)} days of historical data for {ticker}")
                     else:
                         print(f"No historical data found for {ticker} in date range {start_date} to {end_date}")
                         stock_data['has_historical_data'] = False
@@ -260,19 +347,19 @@ class StockDataService:
     async def get_stock_info(self, ticker: str) -> Optional[Dict[str, Any]]:
         """Get comprehensive stock information using Finnhub for all current data."""
         try:
-            # Get current quote from Finnhub
-            quote_data = self._make_finnhub_request(f"quote", {"symbol": ticker.upper()})
+            symbol = ticker.upper()
+            
+            # Quote, company profile and basic financial metrics from Finnhub, fetched concurrently
+            quote_data, profile_data, basic_financials = await asyncio.gather(
+                self._make_finnhub_request("quote", {"symbol": symbol}),
+                self._make_finnhub_request("stock/profile2", {"symbol": symbol}),
+                self._make_finnhub_request("stock/metric", {"symbol": symbol, "metric": "all"})
+            )
             
             if not quote_data or quote_data.get('c') is None:
                 print(f"No quote data found for ticker: {ticker}")
                 return None
             
-            # Get company profile from Finnhub
-            profile_data = self._make_finnhub_request(f"stock/profile2", {"symbol": ticker.upper()})
-            
-            # Get basic financial metrics from Finnhub
-            basic_financials = self._make_finnhub_request(f"stock/metric", {"symbol": ticker.upper(), "metric": "all"})
-            
             current_price = quote_data.get('c', 0)  # current price
             previous_close = quote_data.get('pc', 0)  # previous close
             change = current_price - previous_close if current_price and previous_close else 0
@@ -327,18 +414,98 @@ class StockDataService:
             print(f"Error fetching info for {ticker}: {e}")
             return None
 
+    async def _get_quote_row(self, symbol: str, include_profile: bool) -> Optional[Dict[str, Any]]:
+        """Fetch one symbol's quote (and optionally profile) as a flat row for batch responses."""
+        quote_data, profile_data = await asyncio.gather(
+            self._make_finnhub_request("quote", {"symbol": symbol}),
+            # Profiles only decorate the row (name, logo), so they yield to quote requests
+            self._make_finnhub_request("stock/profile2", {"symbol": symbol}, priority=PRIORITY_BACKGROUND)
+            if include_profile else self._skip_request()
+        )
+        
+        if not quote_data or not quote_data.get('c'):
+            return None
+        
+        current_price = quote_data.get('c', 0)
+        previous_close = quote_data.get('pc', 0)
+        change = current_price - previous_close if previous_close else 0
+        
+        row = {
+            'current_price': current_price,
+            'change': round(change, 2),
+            'change_percent': round(change / previous_close * 100, 2) if previous_close else 0,
+            'previous_close': previous_close,
+            'day_high': quote_data.get('h', 0),
+            'day_low': quote_data.get('l', 0),
+            'day_open': quote_data.get('o', 0),
+            'quote_time': quote_data.get('t'),
+        }
+        if include_profile:
+            row.update({
+                'company_name': profile_data.get('name', symbol) if profile_data else symbol,
+                'logo': profile_data.get('logo') if profile_data else None,
+                'market_cap': profile_data.get('marketCapitalization') if profile_data else None,
+            })
+        return row
+
+    async def get_quotes_batch(self, symbols: List[str], include_profile: bool = True,
+                               wait_seconds: float = 5.0) -> Dict[str, Any]:
+        """
+        Get quotes for many symbols as one columnar response.
+        
+        Cached symbols resolve immediately; missing ones are fetched concurrently within the
+        Finnhub rate budget. Symbols still in flight after wait_seconds are reported as pending
+        and keep fetching in the background, so a follow-up call returns them from cache.
+        """
+        symbols = list(dict.fromkeys(s.upper() for s in symbols if s))
+        tasks = {symbol: asyncio.ensure_future(self._get_quote_row(symbol, include_profile)) for symbol in symbols}
+        
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=wait_seconds)
+        
+        fields = ['current_price', 'change', 'change_percent', 'previous_close',
+                  'day_high', 'day_low', 'day_open', 'quote_time']
+        if include_profile:
+            fields += ['company_name', 'logo', 'market_cap']
+        
+        resolved = []
+        columns = {field: [] for field in fields}
+        pending = []
+        unavailable = []
+        
+        for symbol, task in tasks.items():
+            if not task.done():
+                pending.append(symbol)
+                continue
+            row = task.result()
+            if row is None:
+                unavailable.append(symbol)
+                continue
+            resolved.append(symbol)
+            for field in fields:
+                columns[field].append(row.get(field))
+        
+        return {
+            'symbols': resolved,
+            'columns': columns,
+            'pending': pending,
+            'unavailable': unavailable,
+            'complete': not pending
+        }
+
     async def get_financial_news(self, ticker_symbol: str) -> List[Dict[str, Any]]:
         """Fetches financial news from NewsAPI."""
         if not self.news_api_key:
             return []
         try:
-            newsapi = NewsApiClient(api_key=self.news_api_key)
-            response = newsapi.get_everything(
-                q=ticker_symbol, 
-                language='en', 
-                sort_by='relevancy', 
-                page_size=20
-            )
+            await self.rate_limiter.acquire('newsapi')
+            response = await self.http.get_json('newsapi', self.news_api_url, {
+                'q': ticker_symbol,
+                'language': 'en',
+                'sortBy': 'relevancy',
+                'pageSize': 20,
+                'apiKey': self.news_api_key
+            })
             return response.get('articles', [])
         except Exception as e:
             print(f"Error fetching news for {ticker_symbol}: {e}")
@@ -355,11 +522,16 @@ class StockDataService:
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics and information."""
         return self.cache.get_cache_stats()
+
+    def get_rate_limit_budget(self) -> Dict[str, Any]:
+        """Get the remaining request budget for each upstream provider."""
+        return self.rate_limiter.get_budget()
     
     def clear_cache(self) -> bool:
         """Clear all cached data."""
         try:
             self.cache.clear_all()
+            self.history_store.clear_all()
             return True
         except Exception as e:
             print(f"Error clearing cache: {e}")
@@ -369,5 +541,30 @@ class StockDataService:
         """List all cached items with their details."""
         return self.cache.list_cached_items()
 
+    async def close(self):
+        """Close pooled upstream connections."""
+        await self.http.aclose()
+
+    def _run_sync(self, coro):
+        """Run a coroutine to completion for synchronous callers such as scripts."""
+        async def runner():
+            try:
+                return await coro
+            finally:
+                await self.close()
+        return asyncio.run(runner())
+
+    def get_stock_data_sync(self, ticker: str, start_date: str = None, end_date: str = None) -> Optional[Dict[str, Any]]:
+        """Synchronous facade for get_stock_data (not for use inside the event loop)."""
+        return self._run_sync(self.get_stock_data(ticker, start_date, end_date))
+
+    def get_stock_info_sync(self, ticker: str) -> Optional[Dict[str, Any]]:
+        """Synchronous facade for get_stock_info (not for use inside the event loop)."""
+        return self._run_sync(self.get_stock_info(ticker))
+
+    def get_financial_news_sync(self, ticker_symbol: str) -> List[Dict[str, Any]]:
+        """Synchronous facade for get_financial_news (not for use inside the event loop)."""
+        return self._run_sync(self.get_financial_news(ticker_symbol))
+
 # Global instance
 stock_service = StockDataService()
@@ -0,0 +1,506 @@
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+RISK_PER_TRADE = 100  # Assumed $ risk per trade for R-multiples until position sizing is tracked
+ROLLING_TRADE_WINDOWS = (20, 50, 100, 250)
+ROLLING_CALENDAR_DAYS = (7, 30, 90)
+HOLDING_PERIODS = (
+    ('scalp', 3600),           # < 1 hour
+    ('intraday', 86400),       # same day
+    ('swing', 7 * 86400),      # 1-7 days
+    ('position', np.inf)       # > 7 days
+)
+
+
+def _clock(time_str: str) -> int:
+    """Seconds since midnight for an "HH:MM[:SS]" string, or -1 if it can't be read"""
+    if not time_str or ':' not in time_str:
+        return -1
+    try:
+        parts = time_str.split(':')
+        seconds = int(parts[0]) * 3600 + int(parts[1]) * 60
+        if len(parts) > 2:
+            seconds += int(float(parts[2]))
+        return seconds
+    except ValueError:
+        return -1
+
+
+def _parse_clock(times: List[str]) -> np.ndarray:
+    """Seconds since midnight per time string; one vectorised parse when all are well formed"""
+    try:
+        return np.array(['1970-01-01T' + t for t in times], dtype='datetime64[s]').astype('i8')
+    except ValueError:
+        return np.array([_clock(t) for t in times], dtype='i8')
+
+
+def _parse_days(dates: List[str]) -> np.ndarray:
+    """YYYY-MM-DD strings to datetime64[D]; unreadable dates become NaT"""
+    try:
+        return np.array(dates, dtype='datetime64[D]')
+    except ValueError:
+        days = np.full(len(dates), np.datetime64('NaT'), dtype='datetime64[D]')
+        for i, day in enumerate(dates):
+            try:
+                days[i] = np.datetime64(day, 'D')
+            except ValueError:
+                pass
+        return days
+
+
+def _is_crypto(symbol: str) -> bool:
+    # Crypto typically has USDT, USD pairs or is traded on crypto exchanges
+    return "USD" in symbol or "BINANCE" in symbol
+
+
+class TradeFrame:
+    def __init__(self, trades: List[Dict[str, Any]]):
+        """
+        Columnar view of one account's trade history for the coach KPIs
+
+        Every column is extracted and parsed once (dates to day numbers,
+        times to seconds, symbols to integer codes); each KPI is then a few
+        masked reductions or bincount group-bys over the arrays instead of
+        another pass over the trade dicts.
+
+        Args:
+            trades: The account's trades, in recorded order
+        """
+        self.trades = trades
+        self.n = len(trades)
+        self.pnl = np.array([t.get("realized_pnl", 0) or 0 for t in trades], dtype='f8')
+        self.gross_value = np.array([t.get("gross_value", 0) or 0 for t in trades], dtype='f8')
+
+        date_strings = [t.get("trade_date", "") for t in trades]
+        time_strings = [t.get("trade_time", "") for t in trades]
+        days = _parse_days(date_strings)
+        valid_day = ~np.isnat(days)
+        day_numbers = days.astype('i8')
+        # 1970-01-01 was a Thursday; weekday codes are Monday=0 .. Sunday=6
+        self.weekday = np.where(valid_day, (day_numbers + 3) % 7, -1)
+
+        seconds = _parse_clock(time_strings)
+        self.hour = np.where(seconds >= 0, seconds // 3600, -1)
+        self.epoch = np.where(valid_day, day_numbers * 86400 + np.maximum(seconds, 0), -1)
+
+        self.symbols, self.symbol_code = np.unique(
+            np.array([t.get("symbol", "") for t in trades], dtype=str), return_inverse=True
+        )
+        self.crypto = np.array([_is_crypto(s) for s in self.symbols.tolist()], dtype=bool)[self.symbol_code] \
+            if self.n else np.zeros(0, dtype=bool)
+
+        self.closed = self.pnl != 0
+        # Closed trades in (trade_date, trade_time) order, for the equity curve and rolling windows
+        by_time = np.lexsort((seconds, day_numbers))
+        self.closed_order = by_time[self.closed[by_time]]
+
+    @classmethod
+    def from_trades(cls, trades: List[Dict[str, Any]]) -> "TradeFrame":
+        return cls(trades)
+
+    # ---- group-by helpers -------------------------------------------------
+
+    @staticmethod
+    def _pnl_groups(codes: np.ndarray, pnl: np.ndarray, size: int) -> Dict[str, np.ndarray]:
+        """Per-group count, P&L sum, winners and losers, via bincount"""
+        wins = pnl > 0
+        losses = pnl < 0
+        return {
+            'count': np.bincount(codes, minlength=size),
+            'pnl': np.bincount(codes, weights=pnl, minlength=size),
+            'wins': np.bincount(codes, weights=wins, minlength=size),
+            'win_pnl': np.bincount(codes, weights=np.where(wins, pnl, 0), minlength=size),
+            'losses': np.bincount(codes, weights=losses, minlength=size),
+            'loss_pnl': np.bincount(codes, weights=np.where(losses, pnl, 0), minlength=size),
+        }
+
+    def _pattern_buckets(self, mask: np.ndarray, codes: np.ndarray, labels) -> Dict[Any, Dict[str, Any]]:
+        groups = self._pnl_groups(codes[mask], self.pnl[mask], len(labels))
+        return {
+            labels[k]: {
+                "trade_count": int(groups['count'][k]),
+                "pnl": float(groups['pnl'][k]),
+                "win_rate": float(groups['wins'][k] / groups['count'][k])
+            }
+            for k in np.flatnonzero(groups['count']).tolist()
+        }
+
+    def _expectancy_buckets(self, mask: np.ndarray, codes: np.ndarray, labels) -> Dict[Any, Dict[str, Any]]:
+        groups = self._pnl_groups(codes[mask], self.pnl[mask], len(labels))
+        buckets = {}
+        for k in np.flatnonzero(groups['count']).tolist():
+            count = int(groups['count'][k])
+            avg = float(groups['pnl'][k] / count)
+            buckets[labels[k]] = {
+                "total_pnl": float(groups['pnl'][k]),
+                "avg_dollar_per_trade": avg,
+                "win_rate": float(groups['wins'][k] / count),
+                "avg_win": float(groups['win_pnl'][k] / groups['wins'][k]) if groups['wins'][k] else 0,
+                "avg_loss": float(groups['loss_pnl'][k] / groups['losses'][k]) if groups['losses'][k] else 0,
+                "trade_count": count,
+                "r_expectancy": avg / RISK_PER_TRADE
+            }
+        return buckets
+
+    @staticmethod
+    def _drawdown_runs(equity: np.ndarray):
+        """
+        Running peak and the index each drawdown run started at
+
+        A trade is a new high when equity exceeds the previous peak (which
+        starts at 0); every other trade belongs to the run that began right
+        after the last new high.
+        """
+        peak = np.maximum.accumulate(np.maximum(equity, 0))
+        previous_peak = np.concatenate(([0.0], peak[:-1]))
+        new_high = equity > previous_peak
+        index = np.arange(len(equity))
+        run_start = np.maximum.accumulate(np.where(new_high, index + 1, 0))
+        return peak, new_high, run_start
+
+    # ---- KPIs -------------------------------------------------------------
+
+    def performance_metrics(self) -> Dict[str, Any]:
+        """Key performance metrics; closed trades are those with realized P&L"""
+        closed_pnl = self.pnl[self.closed]
+        wins = closed_pnl[closed_pnl > 0]
+        losses = closed_pnl[closed_pnl < 0]
+        total_wins = float(wins.sum())
+        total_losses = abs(float(losses.sum()))
+        return {
+            "total_trades": self.n,
+            "closed_trades": len(closed_pnl),
+            "open_trades": self.n - len(closed_pnl),
+            "win_rate": len(wins) / len(closed_pnl) if len(closed_pnl) else 0,
+            "profit_factor": total_wins / total_losses if total_losses > 0 else (999 if self.n else 0),
+            "total_pnl": float(self.pnl.sum()),
+            "avg_win": total_wins / len(wins) if len(wins) else 0,
+            "avg_loss": total_losses / len(losses) if len(losses) else 0,
+            "drawdown_metrics": self.max_drawdown(),
+            "winning_trades_count": len(wins),
+            "losing_trades_count": len(losses)
+        }
+
+    def max_drawdown(self) -> Dict[str, Any]:
+        """Largest dollar drawdown of the closed-trade equity curve, with its % and duration"""
+        equity = np.cumsum(self.pnl[self.closed_order])
+        if not len(equity):
+            return {"max_drawdown_pct": 0, "max_drawdown_duration": 0, "max_drawdown_amount": 0}
+        peak, _, run_start = self._drawdown_runs(equity)
+        drawdown = peak - equity
+        i = int(np.argmax(drawdown))
+        if drawdown[i] <= 0:
+            return {"max_drawdown_pct": 0, "max_drawdown_duration": 0, "max_drawdown_amount": 0}
+        return {
+            "max_drawdown_pct": float(drawdown[i] / peak[i] * 100) if peak[i] > 0 else 0,
+            "max_drawdown_duration": int(i - run_start[i] + 1),
+            "max_drawdown_amount": float(drawdown[i])
+        }
+
+    def equity_curve_stats(self) -> Dict[str, Any]:
+        """Closed-trade equity curve with % drawdown and time spent underwater"""
+        equity = np.cumsum(self.pnl[self.closed_order])
+        if not len(equity):
+            return {"max_drawdown_pct": 0, "max_drawdown_duration": 0, "equity_curve": [], "final_equity": 0,
+                    "peak_equity": 0, "underwater_periods": [], "avg_underwater_period": 0}
+        peak, new_high, run_start = self._drawdown_runs(equity)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drawdown_pct = np.where(peak > 0, (peak - equity) / peak * 100, 0.0)
+        i = int(np.argmax(drawdown_pct))
+        # An underwater period ends at the first new high after a drawdown run
+        recovered = np.flatnonzero(new_high[1:] & ~new_high[:-1]) + 1
+        underwater_periods = (recovered - run_start[recovered - 1]).tolist()
+        return {
+            "max_drawdown_pct": float(drawdown_pct[i]),
+            "max_drawdown_duration": int(i - run_start[i] + 1) if drawdown_pct[i] > 0 else 0,
+            "equity_curve": equity.tolist(),
+            "final_equity": float(equity[-1]),
+            "peak_equity": float(peak[-1]),
+            "underwater_periods": underwater_periods,
+            "avg_underwater_period": sum(underwater_periods) / len(underwater_periods) if underwater_periods else 0
+        }
+
+    def time_patterns(self) -> Dict[str, Any]:
+        """Closed-trade win rate and P&L by hour and weekday, split into equities and crypto"""
+        hours = list(range(24))
+        patterns = {}
+        for asset_class, in_class in (("equities", ~self.crypto), ("crypto", self.crypto)):
+            closed = self.closed & in_class
+            # Midnight trades are likely system/settlement trades; equities don't trade at weekends
+            by_hour = closed & (self.hour > 0) & (self.hour < 24)
+            by_day = closed & (self.weekday >= 0)
+            if asset_class == "equities":
+                by_day &= self.weekday < 5
+            patterns[asset_class] = {
+                "by_hour": self._pattern_buckets(by_hour, self.hour, hours),
+                "by_day": self._pattern_buckets(by_day, self.weekday, WEEKDAYS)
+            }
+        return patterns
+
+    def expectancy_metrics(self) -> Dict[str, Any]:
+        """Closed-trade expectancy per symbol, hour and weekday"""
+        return {
+            "by_symbol": self._expectancy_buckets(self.closed, self.symbol_code, self.symbols.tolist()),
+            "by_hour": self._expectancy_buckets(self.closed & (self.hour >= 0) & (self.hour < 24),
+                                                self.hour, list(range(24))),
+            "by_weekday": self._expectancy_buckets(self.closed & (self.weekday >= 0), self.weekday, WEEKDAYS)
+        }
+
+    def r_multiple_distribution(self) -> Dict[str, Any]:
+        """R-multiples at the assumed risk per trade, with MAE/MFE estimated from realized P&L"""
+        closed_pnl = self.pnl[self.closed]
+        r = closed_pnl / RISK_PER_TRADE
+        # MAE/MFE would need to be tracked during trade execution
+        mae = np.where(closed_pnl < 0, -closed_pnl, 0.0)
+        mfe = np.where(closed_pnl < 0, 0.0, closed_pnl)
+        counts = np.histogram(r, bins=[-np.inf, 0, 1, 2, 5, np.inf])[0].tolist() if len(r) else [0] * 5
+        empty = not len(r)
+        return {
+            "avg_r": 0 if empty else float(r.mean()),
+            "max_r": 0 if empty else float(r.max()),
+            "min_r": 0 if empty else float(r.min()),
+            "r_distribution": dict(zip(("negative", "0_to_1R", "1_to_2R", "2_to_5R", "5R_plus"), counts)),
+            "mae_mfe": {
+                "avg_mae": 0 if empty else float(mae.mean()),
+                "avg_mfe": 0 if empty else float(mfe.mean()),
+                "max_mae": 0 if empty else float(mae.max()),
+                "max_mfe": 0 if empty else float(mfe.max())
+            }
+        }
+
+    def holding_periods(self) -> np.ndarray:
+        """
+        Seconds each closed sell was held: from the quantity-weighted entry
+        time of the lots it closed to the sell. NaN where the lots are
+        unknown (no lot_matches, or the buys aren't in this history).
+        """
+        held = np.full(self.n, np.nan)
+        row_of = {t.get("trade_id"): i for i, t in enumerate(self.trades)}
+        for i in np.flatnonzero(self.closed & (self.epoch >= 0)).tolist():
+            matches = self.trades[i].get("lot_matches")
+            if not matches:
+                continue
+            rows = [row_of.get(m.get("trade_id")) for m in matches]
+            if any(row is None or self.epoch[row] < 0 for row in rows):
+                continue
+            quantity = np.array([m.get("quantity", 0) for m in matches], dtype='f8')
+            if quantity.sum() > 0:
+                entry = float(np.dot(self.epoch[rows], quantity) / quantity.sum())
+                held[i] = max(self.epoch[i] - entry, 0.0)
+        return held
+
+    def holding_period_distribution(self) -> Dict[str, Any]:
+        """Closed-trade outcomes by how long the closed lots were held"""
+        held = self.holding_periods()
+        known = ~np.isnan(held)
+        bounds = np.array([limit for _, limit in HOLDING_PERIODS])
+        codes = np.searchsorted(bounds, np.where(known, held, 0), side='right')
+        groups = self._pnl_groups(codes[known], self.pnl[known], len(HOLDING_PERIODS))
+        categories = {}
+        for k, (name, _) in enumerate(HOLDING_PERIODS):
+            in_category = known & (codes == k)
+            count = int(groups['count'][k])
+            categories[name] = {"total_pnl": float(groups['pnl'][k])}
+            if count:
+                categories[name].update({
+                    "trade_count": count,
+                    "win_rate": float(groups['wins'][k] / count),
+                    "avg_pnl": float(groups['pnl'][k] / count),
+                    "best_trade": float(self.pnl[in_category].max()),
+                    "worst_trade": float(self.pnl[in_category].min())
+                })
+        return categories
+
+    @staticmethod
+    def _window_stats(pnl: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Profit factor, Sharpe, win rate and count for pnl[start:end] windows
+
+        Every window is a difference of prefix sums, so any number of windows
+        of any lengths costs O(n) to prepare and O(1) each. Variance comes from
+        sums of squares taken around the overall mean, which keeps the
+        subtraction well conditioned.
+        """
+        centred = pnl - (pnl.mean() if len(pnl) else 0.0)
+
+        def prefix(values: np.ndarray) -> np.ndarray:
+            return np.concatenate(([0.0], np.cumsum(values)))
+
+        def window_sum(sums: np.ndarray) -> np.ndarray:
+            return sums[ends] - sums[starts]
+
+        count = ends - starts
+        total = window_sum(prefix(pnl))
+        wins = window_sum(prefix(np.where(pnl > 0, pnl, 0.0)))
+        losses = -window_sum(prefix(np.where(pnl < 0, pnl, 0.0)))
+        winners = window_sum(prefix(pnl > 0))
+        centred_sum = window_sum(prefix(centred))
+        squares = window_sum(prefix(centred * centred))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            deviation = squares - centred_sum * centred_sum / count
+            # Rounding can leave a flat window a hair above zero variance
+            flat = deviation <= 1e-9 * squares
+            std = np.sqrt(np.maximum(deviation, 0) / (count - 1))
+            sharpe = np.where((count > 1) & ~flat, total / count / std * np.sqrt(252), 0.0)
+            return {
+                'profit_factor': np.where(losses > 0, wins / losses, 999.0),
+                'sharpe': sharpe,
+                'win_rate': np.where(count > 0, winners / count, 0.0),
+                'trade_count': count
+            }
+
+    def rolling_metrics(self, window: int = 30) -> Dict[str, Any]:
+        """Profit factor and annualised Sharpe over trailing windows of closed trades"""
+        empty = {"rolling_profit_factor": [], "rolling_sharpe": [], "current_pf": 0, "current_sharpe": 0,
+                 "pf_trend": "declining"}
+        closed_pnl = self.pnl[self.closed_order]
+        if self.n < window or len(closed_pnl) <= window:
+            return empty
+        # Windows end before each trade from `window` onwards
+        starts = np.arange(len(closed_pnl) - window)
+        stats = self._window_stats(closed_pnl, starts, starts + window)
+        rolling_pf = stats['profit_factor'].tolist()
+        rolling_sharpe = stats['sharpe'].tolist()
+        return {
+            "rolling_profit_factor": rolling_pf,
+            "rolling_sharpe": rolling_sharpe,
+            "current_pf": rolling_pf[-1],
+            "current_sharpe": rolling_sharpe[-1],
+            "pf_trend": "improving" if len(rolling_pf) >= 2 and rolling_pf[-1] > rolling_pf[-2] else "declining"
+        }
+
+    def rolling_series(self, trade_windows=ROLLING_TRADE_WINDOWS,
+                       calendar_days=ROLLING_CALENDAR_DAYS) -> Dict[str, Any]:
+        """
+        Rolling profit factor, Sharpe and win rate after every closed trade, for charting
+
+        Trade windows cover the last N closed trades and start once N trades
+        exist (earlier points are None). Calendar windows cover the closed
+        trades in the last D days up to and including each trade.
+
+        Args:
+            trade_windows: Window lengths in closed trades
+            calendar_days: Window lengths in days
+
+        Returns:
+            The closed trades' ids and timestamps (the shared x axis) and one
+            series per window, each aligned to that axis
+        """
+        order = self.closed_order
+        pnl = self.pnl[order]
+        epoch = self.epoch[order]
+        dated = epoch >= 0
+        n = len(pnl)
+        ends = np.arange(1, n + 1)
+
+        def series(stats: Dict[str, np.ndarray], valid: np.ndarray) -> Dict[str, List[Any]]:
+            return {
+                name: [value if ok else None for value, ok in zip(values.tolist(), valid.tolist())]
+                for name, values in stats.items()
+            }
+
+        windows = []
+        for window in trade_windows:
+            starts = np.maximum(ends - window, 0)
+            windows.append({'window': f"{window}T", 'unit': 'trades', 'length': window,
+                            **series(self._window_stats(pnl, starts, ends), ends >= window)})
+        for days in calendar_days:
+            starts = np.searchsorted(epoch, epoch - days * 86400, side='right')
+            windows.append({'window': f"{days}D", 'unit': 'days', 'length': days,
+                            **series(self._window_stats(pnl, starts, ends), dated)})
+
+        timestamps = np.datetime_as_string(np.where(dated, epoch, 0).astype('datetime64[s]')).tolist()
+        return {
+            'trade_ids': [self.trades[i].get('trade_id') for i in order.tolist()],
+            'timestamps': [t if ok else None for t, ok in zip(timestamps, dated.tolist())],
+            'pnl': pnl.tolist(),
+            'windows': windows
+        }
+
+    def capital_utilization(self, portfolio: Dict[str, Any]) -> Dict[str, Any]:
+        """Trade size as a % of capital, overall and by hour and weekday"""
+        if not self.n:
+            return {"avg_exposure": 0, "max_exposure": 0, "by_hour": {}, "by_day": {}}
+        cash_balance = portfolio.get("cash", 10000)  # Default assumption
+        total_capital = cash_balance + sum(pos.get("market_value", 0) for pos in portfolio.get("positions", {}).values())
+        exposure = self.gross_value / total_capital * 100 if total_capital > 0 else np.zeros(self.n)
+
+        def buckets(mask: np.ndarray, codes: np.ndarray, labels) -> Dict[Any, Dict[str, Any]]:
+            count = np.bincount(codes[mask], minlength=len(labels))
+            total = np.bincount(codes[mask], weights=exposure[mask], minlength=len(labels))
+            return {
+                labels[k]: {"avg_exposure": float(total[k] / count[k]), "trade_count": int(count[k])}
+                for k in np.flatnonzero(count).tolist()
+            }
+
+        return {
+            "avg_exposure": float(exposure.mean()),
+            "max_exposure": float(exposure.max()),
+            "by_hour": buckets((self.hour >= 0) & (self.hour < 24), self.hour, list(range(24))),
+            "by_day": buckets(self.weekday >= 0, self.weekday, WEEKDAYS)
+        }
+
+    def pareto_concentration(self) -> Dict[str, Any]:
+        """Share of total P&L made by the best 10% and 20% of closed trades"""
+        pnl = -np.sort(-self.pnl[self.closed])
+        total_pnl = float(pnl.sum())
+        if total_pnl <= 0:
+            return {"top_10_pct": 0, "top_20_pct": 0, "top_10_trades": [],
+                    "concentration_risk": "High" if self.n else "Low", "total_trades": len(pnl)}
+
+        top_10_count = max(1, len(pnl) // 10)
+        top_20_count = max(1, len(pnl) // 5)
+        top_10_pct = float(pnl[:top_10_count].sum()) / total_pnl * 100
+        top_20_pct = float(pnl[:top_20_count].sum()) / total_pnl * 100
+
+        if top_10_pct > 80:
+            risk = "Very High"
+        elif top_10_pct > 60:
+            risk = "High"
+        elif top_10_pct > 40:
+            risk = "Medium"
+        else:
+            risk = "Low"
+
+        return {
+            "top_10_pct": top_10_pct,
+            "top_20_pct": top_20_pct,
+            "top_10_trades": pnl[:top_10_count].tolist(),
+            "concentration_risk": risk,
+            "total_trades": len(pnl)
+        }
+
+    def symbol_performance(self) -> Dict[str, Any]:
+        """P&L, volume and win rate per symbol over all trades"""
+        size = len(self.symbols)
+        count = np.bincount(self.symbol_code, minlength=size)
+        pnl = np.bincount(self.symbol_code, weights=self.pnl, minlength=size)
+        volume = np.bincount(self.symbol_code, weights=self.gross_value, minlength=size)
+        wins = np.bincount(self.symbol_code, weights=self.pnl > 0, minlength=size)
+        return {
+            symbol: {
+                "pnl": float(pnl[k]),
+                "total_volume": float(volume[k]),
+                "win_rate": float(wins[k] / count[k]),
+                "trade_count": int(count[k]),
+                "expectancy_per_trade": float(pnl[k] / count[k])
+            }
+            for k, symbol in enumerate(self.symbols.tolist())
+        }
+
+    def report(self, portfolio: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Every coach KPI, keyed by section"""
+        return {
+            "metrics": self.performance_metrics(),
+            "patterns": self.time_patterns(),
+            "symbol_performance": self.symbol_performance(),
+            "expectancy": self.expectancy_metrics(),
+            "r_multiples": self.r_multiple_distribution(),
+            "equity_curve": self.equity_curve_stats(),
+            "holding_periods": self.holding_period_distribution(),
+            "rolling": self.rolling_metrics(),
+            "capital_utilization": self.capital_utilization(portfolio or {}),
+            "pareto": self.pareto_concentration()
+        }
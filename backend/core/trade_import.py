@@ -0,0 +1,336 @@
+import csv
+import io
+import json
+import math
+import uuid
+import numpy as np
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.lot_book import LotBook
+from core.trade_index import TradeHistoryIndex
+
+MAX_REPORTED_ERRORS = 50
+
+# Accepted trade_time layouts; stored as HH:MM:SS so times sort as strings
+TIME_FORMATS = ('%H:%M:%S', '%H:%M', '%H:%M:%S.%f')
+
+
+class TradeImportError(Exception):
+    """Raised when an import batch is rejected; nothing from the batch is recorded"""
+
+    def __init__(self, message: str, errors: Optional[List[str]] = None):
+        super().__init__(message)
+        self.errors = (errors or [])[:MAX_REPORTED_ERRORS]
+
+
+def parse_trade_file(content: bytes, file_format: str) -> List[Dict[str, Any]]:
+    """Parse an uploaded CSV (header row, export column names) or NDJSON file into row dicts"""
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        raise TradeImportError(f"File is not UTF-8 text (invalid byte at offset {e.start})")
+    if file_format == 'ndjson':
+        rows = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise TradeImportError(f"Line {line_number} is not valid JSON")
+        return rows
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _parse_time(value: Any) -> str:
+    """Normalise a trade time to HH:MM:SS (missing = midnight); ValueError if unreadable"""
+    text = str(value or '00:00:00').strip()
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, time_format).strftime('%H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"unreadable trade_time {text!r}")
+
+
+def _parse_rows(rows: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[str]]:
+    """Validate rows and split them into columns"""
+    columns = {name: [] for name in ('symbol', 'side', 'quantity', 'price', 'commission',
+                                     'trade_date', 'trade_time', 'trade_id', 'exchange', 'market_sector')}
+    errors = []
+    for i, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append(f"Row {i}: expected an object with trade fields")
+            continue
+        try:
+            symbol = str(row.get('symbol') or row.get('ticker') or '').strip().upper()
+            side = str(row.get('side') or row.get('action') or '').strip().upper()
+            quantity = float(row.get('quantity'))
+            price = float(row.get('price'))
+            commission = float(row.get('commission') or 0)
+            day = np.datetime64(str(row.get('trade_date')).strip()[:10], 'D')
+            if np.isnat(day):
+                raise ValueError("missing trade_date")
+        except (TypeError, ValueError):
+            errors.append(f"Row {i}: symbol, side, quantity, price and trade_date (YYYY-MM-DD) are required")
+            continue
+        try:
+            trade_time = _parse_time(row.get('trade_time'))
+        except ValueError:
+            errors.append(f"Row {i}: trade_time must be HH:MM or HH:MM:SS")
+            continue
+        if not symbol or side not in ('BUY', 'SELL'):
+            errors.append(f"Row {i}: side must be BUY or SELL and symbol must be set")
+            continue
+        if not all(math.isfinite(v) for v in (quantity, price, commission)):
+            errors.append(f"Row {i}: quantity, price and commission must be finite numbers")
+            continue
+        if quantity <= 0 or price <= 0 or commission < 0:
+            errors.append(f"Row {i}: quantity and price must be positive and commission non-negative")
+            continue
+
+        columns['symbol'].append(symbol)
+        columns['side'].append(side)
+        columns['quantity'].append(quantity)
+        columns['price'].append(price)
+        columns['commission'].append(commission)
+        columns['trade_date'].append(day)
+        columns['trade_time'].append(trade_time)
+        columns['trade_id'].append(str(row.get('trade_id') or '').strip() or str(uuid.uuid4()))
+        columns['exchange'].append(row.get('exchange') or 'Unknown')
+        columns['market_sector'].append(row.get('market_sector') or 'Unknown')
+    return columns, errors
+
+
+def _fifo_matches(lot_ids: List[Optional[str]], lot_qty: np.ndarray, lot_price: np.ndarray,
+                  sell_qty: np.ndarray, sell_price: np.ndarray) -> Tuple[List[List[Dict[str, Any]]], np.ndarray, np.ndarray]:
+    """
+    Match one symbol's sells to its lots FIFO, all at once
+
+    Lots and sells are laid end to end as cumulative quantity intervals;
+    a sell takes exactly the lots its interval overlaps, so every match is
+    found with two binary searches instead of walking a queue.
+
+    Returns:
+        (lot matches per sell, matched quantity per sell, lot P&L per sell)
+    """
+    lot_end = np.cumsum(lot_qty)
+    lot_start = lot_end - lot_qty
+    sell_end = np.cumsum(sell_qty)
+    sell_start = sell_end - sell_qty
+
+    first = np.searchsorted(lot_end, sell_start, side='right')
+    last = np.searchsorted(lot_start, sell_end, side='left')
+    counts = np.maximum(last - first, 0)
+
+    # Flatten every (sell, lot) overlap into parallel arrays
+    sell_of = np.repeat(np.arange(len(sell_qty)), counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    lot_of = np.repeat(first, counts) + (np.arange(counts.sum()) - offsets)
+    taken = np.minimum(lot_end[lot_of], sell_end[sell_of]) - np.maximum(lot_start[lot_of], sell_start[sell_of])
+
+    matched = np.bincount(sell_of, weights=taken, minlength=len(sell_qty))
+    pnl = np.bincount(sell_of, weights=(sell_price[sell_of] - lot_price[lot_of]) * taken, minlength=len(sell_qty))
+
+    matches: List[List[Dict[str, Any]]] = [[] for _ in range(len(sell_qty))]
+    for s, l, q in zip(sell_of.tolist(), lot_of.tolist(), taken.tolist()):
+        if q > 0:
+            matches[s].append({'trade_id': lot_ids[l], 'quantity': _number(q), 'price': float(lot_price[l])})
+    return matches, matched, pnl
+
+
+def _number(value: float):
+    """Whole quantities stay ints, as in trades entered through the API"""
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def build_import(uid: str, rows: List[Dict[str, Any]], cash: float,
+                 positions: Dict[str, Dict[str, Any]], lots: LotBook,
+                 history: TradeHistoryIndex, lot_method: str = 'FIFO'
+                 ) -> Tuple[List[Dict[str, Any]], float, Dict[str, Optional[Dict[str, Any]]]]:
+    """
+    Validate, order and lot-match a batch of historical trades
+
+    The batch is sorted by date and time, checked as a whole (no sell
+    beyond the shares held, cash never negative, no duplicate trade ids)
+    and FIFO-matched per symbol in one vectorised pass. Other lot methods
+    are matched by the store as the batch is applied.
+
+    Returns:
+        (trade records, cash after the batch, changed positions)
+
+    Raises:
+        TradeImportError: If any row is invalid; the batch is all or nothing
+    """
+    columns, errors = _parse_rows(rows)
+    if errors:
+        raise TradeImportError(f"{len(errors)} invalid rows", errors)
+    n = len(columns['symbol'])
+    if n == 0:
+        raise TradeImportError("No trades to import")
+
+    dates = np.array(columns['trade_date'], dtype='datetime64[D]')
+    times = np.array(columns['trade_time'])
+    order = np.lexsort((times, dates))
+    symbols = np.array(columns['symbol'], dtype=object)[order]
+    is_buy = np.array(columns['side'])[order] == 'BUY'
+    quantity = np.array(columns['quantity'])[order]
+    price = np.array(columns['price'])[order]
+    commission = np.array(columns['commission'])[order]
+    dates, times = dates[order], times[order]
+    trade_ids = [columns['trade_id'][i] for i in order]
+    date_strings = np.datetime_as_string(dates, unit='D').tolist()
+
+    if history.dates and date_strings[0] < history.dates[-1]:
+        raise TradeImportError(
+            f"Imported trades start on {date_strings[0]}, before the account's latest trade ({history.dates[-1]})"
+        )
+
+    duplicates = {t for t in trade_ids if t in history.by_id}
+    if len(set(trade_ids)) != n or duplicates:
+        raise TradeImportError("Duplicate trade ids in batch or already in history", sorted(duplicates))
+
+    # Shares held per symbol after every trade, via a cumulative sum within each symbol group
+    unique_symbols, symbol_codes = np.unique(symbols.astype(str), return_inverse=True)
+    signed = np.where(is_buy, quantity, -quantity)
+    by_symbol = np.argsort(symbol_codes, kind='stable')
+    group_start = np.searchsorted(symbol_codes[by_symbol], np.arange(len(unique_symbols)))
+    running = np.cumsum(signed[by_symbol])
+    running -= np.repeat(running[group_start] - signed[by_symbol][group_start], np.diff(np.append(group_start, n)))
+    opening = np.array([positions.get(s, {}).get('quantity', 0) for s in unique_symbols], dtype='f8')
+    held = np.empty(n)
+    held[by_symbol] = running + opening[symbol_codes[by_symbol]]
+    oversold = np.flatnonzero(held < -1e-9)
+    if len(oversold):
+        raise TradeImportError("Sells exceed shares held", [
+            f"{date_strings[i]} {symbols[i]}: sells {quantity[i]:g}, leaving {held[i]:g}" for i in oversold
+        ])
+
+    gross = quantity * price
+    cash_path = cash + np.cumsum(np.where(is_buy, -(gross + commission), gross - commission))
+    if cash_path.min() < -1e-9:
+        i = int(np.argmax(cash_path < -1e-9))
+        raise TradeImportError(f"Insufficient cash: balance goes to {cash_path[i]:.2f} on {date_strings[i]}")
+
+    # Lot matching per symbol: open lots first, then the batch's buys, in order
+    lot_matches: Dict[int, List[Dict[str, Any]]] = {}
+    lot_pnl: Dict[int, float] = {}
+    if lot_method == 'FIFO':
+        for code, symbol in enumerate(unique_symbols.tolist()):
+            rows_for_symbol = by_symbol[symbol_codes[by_symbol] == code]
+            buys = rows_for_symbol[is_buy[rows_for_symbol]]
+            sells = rows_for_symbol[~is_buy[rows_for_symbol]]
+            if not len(sells):
+                continue
+            open_lots = lots.symbols[symbol].open_lots() if symbol in lots.symbols else []
+            lot_ids = [lot.trade_id for lot in open_lots]
+            lot_qty = [lot.quantity for lot in open_lots]
+            lot_price = [lot.price for lot in open_lots]
+
+            # Shares held without lots (positions predating the lot book) go first as one
+            # untracked lot at the position's average cost. The held check then keeps every
+            # sell within the lots opened before it, so no sell reaches a later buy.
+            position = positions.get(symbol) or {}
+            uncovered = position.get('quantity', 0) - sum(lot_qty)
+            if uncovered > 1e-9:
+                lot_ids.insert(0, None)
+                lot_qty.insert(0, uncovered)
+                lot_price.insert(0, position['avg_price'])
+
+            matches, matched, pnl = _fifo_matches(
+                lot_ids + [trade_ids[i] for i in buys],
+                np.concatenate([lot_qty, quantity[buys]]).astype('f8'),
+                np.concatenate([lot_price, price[buys]]).astype('f8'),
+                quantity[sells], price[sells]
+            )
+            for j, i in enumerate(sells.tolist()):
+                # The untracked lot counts towards P&L but isn't recorded as a match
+                lot_matches[i] = [match for match in matches[j] if match['trade_id'] is not None]
+                if abs(matched[j] - quantity[i]) < 1e-9:
+                    lot_pnl[i] = float(pnl[j])
+
+    # Running position state per symbol; avg_price is re-derived from the open lots below
+    changed: Dict[str, Optional[Dict[str, Any]]] = {}
+    trades = []
+    for i in range(n):
+        symbol = symbols[i]
+        day = date_strings[i]
+        timestamp = f"{day}T{times[i]}"
+        position = changed[symbol] if symbol in changed else positions.get(symbol)
+        qty = _number(quantity[i])
+        value = float(gross[i])
+
+        if is_buy[i]:
+            realized_pnl = 0.0
+            if position:
+                new_quantity = position['quantity'] + qty
+                changed[symbol] = {
+                    'quantity': new_quantity,
+                    'avg_price': (position['quantity'] * position['avg_price'] + value) / new_quantity,
+                    'first_purchase': position['first_purchase']
+                }
+            else:
+                changed[symbol] = {'quantity': qty, 'avg_price': float(price[i]), 'first_purchase': timestamp}
+        else:
+            realized_pnl = lot_pnl.get(i, (float(price[i]) - position['avg_price']) * qty)
+            remaining = _number(position['quantity'] - qty)
+            changed[symbol] = {**position, 'quantity': remaining} if remaining > 0 else None
+
+        trade = {
+            'trade_id': trade_ids[i],
+            'account_id': uid,
+            'symbol': symbol,
+            'instrument_type': 'stock',
+            'side': 'BUY' if is_buy[i] else 'SELL',
+            'quantity': qty,
+            'price': float(price[i]),
+            'trade_date': day,
+            'trade_time': str(times[i]),
+            'commission': float(commission[i]),
+            'currency': 'USD',
+            'gross_value': value,
+            'net_value': value + float(commission[i]) if is_buy[i] else value - float(commission[i]),
+            'realized_pnl': realized_pnl,
+            'matched_trade_ids': [],
+            'lot_method': None if is_buy[i] else lot_method,
+            'exchange': columns['exchange'][order[i]],
+            'market_sector': columns['market_sector'][order[i]],
+            'imported': True,
+            # Legacy fields for backward compatibility
+            'ticker': symbol,
+            'action': 'buy' if is_buy[i] else 'sell',
+            'value': value,
+            'timestamp': timestamp
+        }
+        if i in lot_matches:
+            trade['lot_matches'] = lot_matches[i]
+            trade['matched_trade_ids'] = [match['trade_id'] for match in lot_matches[i]]
+        trades.append(trade)
+
+    _apply_lot_cost(changed, lots, trades)
+    return trades, float(cash_path[-1]), changed
+
+
+def _apply_lot_cost(changed: Dict[str, Optional[Dict[str, Any]]], lots: LotBook,
+                    trades: List[Dict[str, Any]]):
+    """
+    Set each changed position's avg_price from the lots left open after the batch
+
+    Replays the batch over a copy of the touched symbols' open lots, so the cost
+    basis matches the lot-based realized P&L for every lot method. Positions the
+    lot history doesn't fully account for keep their running average cost.
+    """
+    book = LotBook()
+    for symbol in changed:
+        if symbol in lots.symbols:
+            for lot in lots.symbols[symbol].open_lots():
+                book.apply_trade({'symbol': symbol, 'side': 'BUY', 'trade_id': lot.trade_id,
+                                  'price': lot.price, 'quantity': lot.quantity, 'trade_date': lot.trade_date})
+    for trade in trades:
+        book.apply_trade(trade)
+
+    for symbol, position in changed.items():
+        basis = book.cost_basis(symbol)
+        if position and basis is not None and abs(basis['quantity'] - position['quantity']) < 1e-9:
+            position['avg_price'] = basis['avg_price']
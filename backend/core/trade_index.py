@@ -0,0 +1,131 @@
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def trade_symbol(trade: Dict[str, Any]) -> str:
+    return trade.get('symbol') or trade.get('ticker', '')
+
+
+def trade_side(trade: Dict[str, Any]) -> str:
+    return trade.get('side') or trade.get('action', '').upper()
+
+
+def trade_date(trade: Dict[str, Any]) -> str:
+    return trade.get('trade_date') or trade.get('timestamp', '')[:10]
+
+
+class TradeHistoryIndex:
+    def __init__(self, trades: List[Dict[str, Any]]):
+        """
+        Secondary indexes over one account's trade history
+
+        Trades are addressed by their position in the (append-only) history,
+        which also serves as the pagination cursor. Every index holds
+        positions in ascending order, so a cursor is a binary search.
+
+        Args:
+            trades: The account's trade list; the index reads it, never copies it
+        """
+        self.trades = trades
+        self.by_id: Dict[str, int] = {}
+        self.sells: List[int] = []
+        self.by_symbol: Dict[str, List[int]] = {}
+        self.by_date: Dict[str, List[int]] = {}
+        self.dates: List[str] = []  # distinct trade dates, sorted
+        for position, trade in enumerate(trades):
+            self.add(position, trade)
+
+    def add(self, position: int, trade: Dict[str, Any]):
+        """Index the trade stored at `position` (positions must be added in increasing order)"""
+        trade_id = trade.get('trade_id')
+        if trade_id:
+            self.by_id[trade_id] = position
+        if trade_side(trade) == 'SELL':
+            self.sells.append(position)
+
+        self.by_symbol.setdefault(trade_symbol(trade), []).append(position)
+
+        day = trade_date(trade)
+        positions = self.by_date.get(day)
+        if positions is None:
+            positions = self.by_date[day] = []
+            insort(self.dates, day)
+        positions.append(position)
+
+    def get(self, trade_id: str) -> Optional[Dict[str, Any]]:
+        position = self.by_id.get(trade_id)
+        return self.trades[position] if position is not None else None
+
+    def get_sells(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        end = len(self.sells) if limit is None else offset + limit
+        return [self.trades[position] for position in self.sells[offset:end]]
+
+    @staticmethod
+    def _after_cursor(positions: List[int], cursor: Optional[int], descending: bool) -> Iterator[int]:
+        """Positions past the cursor, in page order"""
+        if descending:
+            end = len(positions) if cursor is None else bisect_left(positions, cursor)
+            return (positions[i] for i in range(end - 1, -1, -1))
+        start = 0 if cursor is None else bisect_right(positions, cursor)
+        return (positions[i] for i in range(start, len(positions)))
+
+    def iter_positions(self, symbol: Optional[str] = None, side: Optional[str] = None,
+                       start_date: Optional[str] = None, end_date: Optional[str] = None,
+                       sector: Optional[str] = None, cursor: Optional[int] = None,
+                       descending: bool = False) -> Iterator[int]:
+        """
+        Positions of trades matching the filters, in page order
+
+        Candidates come from the symbol index or the date index, whichever
+        is smaller; the remaining filters are checked per candidate.
+        """
+        date_lists = None
+        if start_date or end_date:
+            lo = bisect_left(self.dates, start_date) if start_date else 0
+            hi = bisect_right(self.dates, end_date) if end_date else len(self.dates)
+            date_lists = [self.by_date[day] for day in self.dates[lo:hi]]
+
+        symbol_list = self.by_symbol.get(symbol, []) if symbol else None
+
+        if symbol_list is not None and (date_lists is None or len(symbol_list) <= sum(map(len, date_lists))):
+            candidates = self._after_cursor(symbol_list, cursor, descending)
+            check_symbol, check_date = False, date_lists is not None
+        elif date_lists is not None:
+            candidates = heapq.merge(
+                *(self._after_cursor(positions, cursor, descending) for positions in date_lists),
+                reverse=descending
+            )
+            check_symbol, check_date = symbol is not None, False
+        else:
+            candidates = self._after_cursor(range(len(self.trades)), cursor, descending)
+            check_symbol, check_date = False, False
+
+        sector = sector.lower() if sector else None
+        for position in candidates:
+            trade = self.trades[position]
+            if check_symbol and trade_symbol(trade) != symbol:
+                continue
+            if check_date:
+                day = trade_date(trade)
+                if (start_date and day < start_date) or (end_date and day > end_date):
+                    continue
+            if side and trade_side(trade) != side:
+                continue
+            if sector and (trade.get('market_sector') or '').lower() != sector:
+                continue
+            yield position
+
+    def query(self, limit: Optional[int] = None, **filters) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        One page of matching trades
+
+        Returns:
+            (trades, next_cursor); next_cursor is None on the last page
+        """
+        page = []
+        for position in self.iter_positions(**filters):
+            if limit is not None and len(page) == limit:
+                return [self.trades[p] for p in page], page[-1]
+            page.append(position)
+        return [self.trades[p] for p in page], None
@@ -0,0 +1,84 @@
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+
+def value_portfolio(cash: float, positions: Dict[str, Dict[str, Any]],
+                    quotes: Dict[str, Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Mark positions to market in one vectorised pass
+
+    Positions without a quote are listed under `unavailable` and left out
+    of the totals.
+
+    Args:
+        cash: Cash balance
+        positions: Ticker -> {'quantity', 'avg_price', ...}
+        quotes: Ticker -> quote book entry (or None)
+
+    Returns:
+        Per-position rows, portfolio totals and the unavailable tickers
+    """
+    tickers = [t for t in positions if quotes.get(t)]
+    unavailable = [t for t in positions if not quotes.get(t)]
+
+    quantity = np.array([positions[t]['quantity'] for t in tickers], dtype='f8')
+    avg_price = np.array([positions[t]['avg_price'] for t in tickers], dtype='f8')
+    price = np.array([quotes[t]['price'] for t in tickers], dtype='f8')
+    previous_close = np.array([quotes[t].get('previous_close') or 0 for t in tickers], dtype='f8')
+
+    market_value = quantity * price
+    cost_basis = quantity * avg_price
+    unrealized_pnl = market_value - cost_basis
+    # Without a previous close the day's move is unknown; count it as flat
+    reference = np.where(previous_close > 0, previous_close, price)
+    day_change = quantity * (price - reference)
+
+    total_market_value = float(market_value.sum())
+    total_cost_basis = float(cost_basis.sum())
+    total_day_change = float(day_change.sum())
+    total_value = cash + total_market_value
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unrealized_pct = np.where(cost_basis > 0, unrealized_pnl / cost_basis * 100, 0.0)
+        day_change_pct = np.where(reference > 0, (price - reference) / reference * 100, 0.0)
+        weight = market_value / total_value * 100 if total_value else np.zeros_like(market_value)
+
+    rows: List[Dict[str, Any]] = []
+    columns = zip(tickers, price.tolist(), previous_close.tolist(), market_value.tolist(),
+                  cost_basis.tolist(), unrealized_pnl.tolist(), unrealized_pct.tolist(),
+                  weight.tolist(), day_change.tolist(), day_change_pct.tolist())
+    for (ticker, px, pc, mv, cb, upnl, upct, w, dc, dcp) in columns:
+        quote = quotes[ticker]
+        rows.append({
+            'ticker': ticker,
+            'quantity': positions[ticker]['quantity'],
+            'avg_price': positions[ticker]['avg_price'],
+            'price': px,
+            'previous_close': pc,
+            'market_value': round(mv, 2),
+            'cost_basis': round(cb, 2),
+            'unrealized_pnl': round(upnl, 2),
+            'unrealized_pnl_percent': round(upct, 2),
+            'weight_percent': round(w, 2),
+            'day_change': round(dc, 2),
+            'day_change_percent': round(dcp, 2),
+            'quote_age_seconds': quote['age_seconds'],
+            'stale': quote['stale']
+        })
+
+    previous_market_value = total_market_value - total_day_change
+    return {
+        'positions': rows,
+        'totals': {
+            'cash': round(cash, 2),
+            'market_value': round(total_market_value, 2),
+            'total_value': round(total_value, 2),
+            'cost_basis': round(total_cost_basis, 2),
+            'unrealized_pnl': round(total_market_value - total_cost_basis, 2),
+            'unrealized_pnl_percent': round((total_market_value - total_cost_basis) / total_cost_basis * 100, 2) if total_cost_basis else 0.0,
+            'day_change': round(total_day_change, 2),
+            'day_change_percent': round(total_day_change / previous_market_value * 100, 2) if previous_market_value else 0.0,
+            'cash_weight_percent': round(cash / total_value * 100, 2) if total_value else 0.0
+        },
+        'unavailable': unavailable
+    }
@@ -14,7 +14,13 @@ from api.auth import router as auth_router
 from api.portfolio import router as portfolio_router
 from api.watchlist import router as watchlist_router
 from api.playground import router as playground_router
-from api.ai_coach import router as ai_coach_router
+from api.ai_coach import router as ai_coach_router, close_openai_client
+from api.stream import router as stream_router
+from core.stock_service import stock_service
+from core.price_hub import price_hub
+from core.bar_aggregator import bar_aggregator
+from core.portfolio_store import portfolio_store
+from core.quote_book import quote_book
 
 # Create FastAPI app
 app = FastAPI(
@@ -32,6 +38,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Roll streamed trades into intraday bars (freed when a symbol stops streaming)
+# and keep the shared quote book current
+price_hub.add_listener(bar_aggregator.on_trade)
+price_hub.add_listener(quote_book.on_trade)
+price_hub.add_release_listener(bar_aggregator.release)
+
 # Include routers
 app.include_router(stocks_router, prefix="/api/stocks", tags=["stocks"])
 app.include_router(auth_router, prefix="/api/auth", tags=["authentication"])
@@ -39,6 +51,16 @@ app.include_router(portfolio_router, prefix="/api/portfolio", tags=["portfolio"]
 app.include_router(watchlist_router, prefix="/api/watchlist", tags=["watchlist"])
 app.include_router(playground_router, prefix="/api/playground", tags=["playground"])
 app.include_router(ai_coach_router, prefix="/api/ai-coach", tags=["ai-coach"])
+app.include_router(stream_router, prefix="/ws", tags=["stream"])
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Close pooled upstream HTTP connections and the shared price stream
+    await stock_service.close()
+    await price_hub.close()
+    await close_openai_client()
+    # Flush the trade journal and write a fresh portfolio snapshot
+    await portfolio_store.close()
 
 @app.get("/")
 async def root():
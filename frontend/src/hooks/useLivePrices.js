@@ -14,18 +14,10 @@ const useLivePrices = (symbols = []) => {
 
     // Setup WebSocket once on mount
     useEffect(() => {
-        const API_KEY = process.env.REACT_APP_FINNHUB_API_KEY;
-
         console.log('useLivePrices: Setting up WebSocket');
 
-        if (!API_KEY) {
-            setError('Finnhub API key not configured');
-            return;
-        }
-
         // Always create the socket, regardless of initial symbols
         const finnhubSocket = new FinnhubSocket({
-            apiKey: API_KEY,
             symbols: [],
             onTrade: (tick) => {
                 setLivePrices(prev => ({
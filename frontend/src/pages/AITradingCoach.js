@@ -25,11 +25,8 @@ const AITradingCoach = () => {
     const [analysis, setAnalysis] = useState(null);
     const [error, setError] = useState(null);
 
-    const runAnalysis = async () => {
+    const runAnalysisRequest = async () => {
         try {
-            setLoading(true);
-            setError(null);
-            
             const response = await api.post('/api/ai-coach/analyze');
             setAnalysis(response.data);
         } catch (err) {
@@ -40,6 +37,52 @@ const AITradingCoach = () => {
         }
     };
 
+    const runAnalysis = () => {
+        setLoading(true);
+        setError(null);
+        setAnalysis(null);
+
+        if (!window.EventSource) {
+            runAnalysisRequest();
+            return;
+        }
+
+        // Stream the Markdown summary as it is generated; `done` carries the full response
+        const source = new EventSource(`${api.defaults.baseURL}/api/ai-coach/analyze/stream`);
+        let finished = false;
+        let received = false;
+
+        source.addEventListener('md', (event) => {
+            const { delta } = JSON.parse(event.data);
+            received = true;
+            setAnalysis((current) => ({
+                ...(current || {}),
+                response_md: ((current && current.response_md) || '') + delta
+            }));
+        });
+
+        source.addEventListener('done', (event) => {
+            finished = true;
+            source.close();
+            setAnalysis(JSON.parse(event.data));
+            setLoading(false);
+        });
+
+        source.onerror = () => {
+            if (finished) {
+                return;
+            }
+            source.close();
+            if (received) {
+                setError('The analysis stream was interrupted. Please try again.');
+                setLoading(false);
+            } else {
+                // Streaming unavailable (e.g. a proxy buffering the response): fall back to one request
+                runAnalysisRequest();
+            }
+        };
+    };
+
     return (
         <Container maxWidth="lg" sx={{ py: 4 }}>
             {/* Header */}
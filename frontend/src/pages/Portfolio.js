@@ -48,6 +48,7 @@ import {
   Link,
 } from '@mui/icons-material';
 import { portfolioAPI, stockAPI } from '../services/api';
+import { quotesToMap } from '../utils/quotes';
 import useLivePrices from '../hooks/useLivePrices';
 import {
   Chart as ChartJS,
@@ -59,6 +60,9 @@ import { Pie } from 'react-chartjs-2';
 
 ChartJS.register(ArcElement, ChartTooltip, Legend);
 
+// How often the server-side valuation is re-fetched while the page is open
+const VALUATION_REFRESH_MS = 15000;
+
 const Portfolio = () => {
   const [portfolio, setPortfolio] = useState(null);
   const [portfolioStats, setPortfolioStats] = useState(null);
@@ -69,7 +73,9 @@ const Portfolio = () => {
   const [pnlDialogOpen, setPnlDialogOpen] = useState(false);
   const [tradeHistory, setTradeHistory] = useState([]);
   const [pnlBreakdown, setPnlBreakdown] = useState([]);
-  const [currentPrices, setCurrentPrices] = useState({});
+  // Server-side mark-to-market (/api/portfolio/valuation); figures are not recomputed here
+  const [valuation, setValuation] = useState(null);
+  const [companyInfo, setCompanyInfo] = useState({});
   const [refreshingPrices, setRefreshingPrices] = useState(false);
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
 
@@ -115,13 +121,21 @@ const Portfolio = () => {
 
   useEffect(() => {
     if (portfolio && portfolio.positions) {
+      fetchValuation();
       const tickers = Object.keys(portfolio.positions);
       if (tickers.length > 0) {
-        fetchCurrentPrices(tickers);
+        fetchCompanyInfo(tickers);
       }
     }
   }, [portfolio]);
 
+  // The server's quote book follows the live stream, so polling the valuation keeps figures current
+  useEffect(() => {
+    if (!portfolio || Object.keys(portfolio.positions || {}).length === 0) return undefined;
+    const timer = setInterval(fetchValuation, VALUATION_REFRESH_MS);
+    return () => clearInterval(timer);
+  }, [portfolio]);
+
   const loadPortfolio = async () => {
     try {
       setLoading(true);
@@ -153,35 +167,32 @@ const Portfolio = () => {
     }
   };
 
-  const fetchCurrentPrices = async (tickers) => {
+  const fetchValuation = async () => {
     try {
       setRefreshingPrices(true);
-      const pricePromises = tickers.map(async (ticker) => {
-        try {
-          const response = await stockAPI.getStockInfo(ticker);
-          return { 
-            ticker, 
-            price: response.data.current_price || response.data.close_prices?.[response.data.close_prices.length - 1] || 0,
-            logo: response.data.logo,
-            company_name: response.data.company_name
-          };
-        } catch (error) {
-          console.error(`Error fetching price for ${ticker}:`, error);
-          return { ticker, price: 0, logo: null, company_name: ticker };
-        }
-      });
+      const response = await portfolioAPI.getValuation();
+      setValuation(response.data.data);
+    } catch (error) {
+      console.error('Error fetching portfolio valuation:', error);
+    } finally {
+      setRefreshingPrices(false);
+    }
+  };
 
-      const priceResults = await Promise.all(pricePromises);
-      const pricesMap = {};
-      priceResults.forEach(({ ticker, price, logo, company_name }) => {
-        pricesMap[ticker] = { price, logo, company_name };
+  // Logos and company names only; prices come from the valuation
+  const fetchCompanyInfo = async (tickers) => {
+    try {
+      const response = await stockAPI.getQuotes(tickers);
+      const quotes = quotesToMap(response.data);
+      const infoMap = {};
+      tickers.forEach((ticker) => {
+        const quote = quotes[ticker];
+        infoMap[ticker] = { logo: quote?.logo || null, company_name: quote?.company_name || ticker };
       });
       
-      setCurrentPrices(pricesMap);
+      setCompanyInfo(infoMap);
     } catch (error) {
-      console.error('Error fetching current prices:', error);
-    } finally {
-      setRefreshingPrices(false);
+      console.error('Error fetching company info:', error);
     }
   };
 
@@ -361,47 +372,32 @@ const Portfolio = () => {
     return new Intl.NumberFormat('en-US').format(num);
   };
 
+  const valuedPositions = {};
+  (valuation?.positions || []).forEach((row) => {
+    valuedPositions[row.ticker] = row;
+  });
+
   const calculatePortfolioStats = () => {
     if (!portfolio) return null;
 
-    let totalValue = portfolio.cash || 0;
-    let totalInvested = 0;
-    let totalCurrentValue = 0;
-    const positionBreakdown = [];
-
-    // If we have positions, calculate their values
-    if (positions && positions.length > 0) {
-      positions.forEach(position => {
-        // Use live price if available, otherwise fall back to static price
-        const livePrice = livePrices[position.ticker]?.price;
-        const currentPrice = livePrice || currentPrices[position.ticker]?.price || 0;
-        
-        const invested = position.quantity * position.avg_price;
-        const currentValue = position.quantity * currentPrice;
-        
-        totalInvested += invested;
-        totalCurrentValue += currentValue;
-        totalValue += currentValue;
-
-        // Add to position breakdown for composition
-        positionBreakdown.push({
-          ticker: position.ticker,
-          currentValue,
-          percentage: 0, // Will calculate after totalValue is known
-          pl: currentValue - invested,
-          plPercent: invested > 0 ? ((currentValue - invested) / invested) * 100 : 0
-        });
-      });
-    }
+    // Totals and per-position figures are marked to market server-side;
+    // positions without a quote are left out until one is available
+    const totals = valuation?.totals;
+    const cash = totals ? totals.cash : (portfolio.cash || 0);
+    const totalValue = totals ? totals.total_value : cash;
+    const totalInvested = totals?.cost_basis || 0;
+    const totalCurrentValue = totals?.market_value || 0;
 
-    // Calculate percentages for composition
-    positionBreakdown.forEach(pos => {
-      pos.percentage = totalValue > 0 ? (pos.currentValue / totalValue) * 100 : 0;
-    });
+    const positionBreakdown = (valuation?.positions || []).map(row => ({
+      ticker: row.ticker,
+      currentValue: row.market_value,
+      percentage: row.weight_percent,
+      pl: row.unrealized_pnl,
+      plPercent: row.unrealized_pnl_percent
+    }));
 
-    // Calculate unrealized P&L (from current positions)
-    const unrealizedPL = totalCurrentValue - totalInvested;
-    const unrealizedPLPercent = totalInvested > 0 ? (unrealizedPL / totalInvested) * 100 : 0;
+    const unrealizedPL = totals?.unrealized_pnl || 0;
+    const unrealizedPLPercent = totals?.unrealized_pnl_percent || 0;
     
     // Get realized P&L from backend stats (fallback to 0 if not available)
     const realizedPL = portfolioStats?.total_realized_pnl || 0;
@@ -416,7 +412,7 @@ const Portfolio = () => {
     const totalReturnPercent = (totalReturn / initialValue) * 100;
 
     return {
-      cash: portfolio.cash || 0,
+      cash,
       totalInvested,
       totalCurrentValue,
       unrealizedPL,
@@ -428,7 +424,7 @@ const Portfolio = () => {
       totalReturn,
       totalReturnPercent,
       positionBreakdown: positionBreakdown.sort((a, b) => b.currentValue - a.currentValue),
-      cashPercentage: totalValue > 0 ? ((portfolio.cash || 0) / totalValue) * 100 : 100
+      cashPercentage: totals ? totals.cash_weight_percent : 100
     };
   };
 
@@ -486,7 +482,7 @@ const Portfolio = () => {
           <Button
             variant="outlined"
             startIcon={<Refresh />}
-            onClick={() => fetchCurrentPrices(Object.keys(portfolio.positions || {}))}
+            onClick={fetchValuation}
             disabled={refreshingPrices}
             sx={{ color: '#5B86E5', borderColor: '#5B86E5' }}
           >
@@ -803,24 +799,23 @@ const Portfolio = () => {
                 </TableHead>
                 <TableBody>
                   {positions.map((position) => {
-                    // Use live price if available, otherwise fall back to static price
-                    const livePrice = livePrices[position.ticker]?.price;
-                    const currentPrice = livePrice || currentPrices[position.ticker]?.price || 0;
-                    const isLive = !!livePrice;
+                    // Marked to market by the valuation endpoint; LIVE when the symbol is streaming
+                    const valued = valuedPositions[position.ticker];
+                    const currentPrice = valued?.price || 0;
+                    const isLive = !!livePrices[position.ticker]?.price;
                     
-                    const currentValue = position.quantity * currentPrice;
-                    const invested = position.quantity * position.avg_price;
-                    const pl = currentValue - invested;
-                    const plPercent = invested > 0 ? (pl / invested) * 100 : 0;
-                    const companyInfo = currentPrices[position.ticker];
+                    const currentValue = valued?.market_value || 0;
+                    const pl = valued?.unrealized_pnl || 0;
+                    const plPercent = valued?.unrealized_pnl_percent || 0;
+                    const info = companyInfo[position.ticker];
 
                     return (
                       <TableRow key={position.ticker} sx={{ '&:hover': { backgroundColor: 'rgba(255, 255, 255, 0.05)' } }}>
                         <TableCell>
                           <Box sx={{ display: 'flex', alignItems: 'center', gap: 2 }}>
-                            {companyInfo?.logo && (
+                            {info?.logo && (
                               <Avatar
-                                src={companyInfo.logo}
+                                src={info.logo}
                                 sx={{ width: 32, height: 32, bgcolor: 'white' }}
                               >
                                 {position.ticker[0]}
@@ -831,7 +826,7 @@ const Portfolio = () => {
                                 {position.ticker}
                               </Typography>
                               <Typography variant="caption" sx={{ color: 'rgba(255, 255, 255, 0.7)' }}>
-                                {companyInfo?.company_name || position.ticker}
+                                {info?.company_name || position.ticker}
                               </Typography>
                             </Box>
                           </Box>
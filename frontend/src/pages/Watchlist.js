@@ -23,6 +23,7 @@ import {
 import { Star, Delete, Info, Article, OpenInNew, Close } from '@mui/icons-material';
 import { watchlistAPI, stockAPI } from '../services/api';
 import useLivePrices from '../hooks/useLivePrices';
+import { quotesToMap } from '../utils/quotes';
 import toast from 'react-hot-toast';
 
 const Watchlist = () => {
@@ -44,21 +45,10 @@ const Watchlist = () => {
       const tickers = response.data;
       setWatchlist(tickers);
 
-      // Fetch current prices for each stock
-      const promises = tickers.map(async (ticker) => {
-        try {
-          const stockRes = await stockAPI.getStockInfo(ticker);
-          return { ticker, data: stockRes.data };
-        } catch (error) {
-          return { ticker, data: null };
-        }
-      });
-
-      const results = await Promise.all(promises);
-      const newStockData = {};
-      results.forEach(({ ticker, data }) => {
-        if (data) newStockData[ticker] = data;
-      });
+      // Fetch current prices for all stocks in one batch request
+      const newStockData = tickers.length > 0
+        ? quotesToMap((await stockAPI.getQuotes(tickers)).data)
+        : {};
       setStockData(newStockData);
     } catch (error) {
       toast.error('Failed to load watchlist');
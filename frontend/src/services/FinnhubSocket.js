@@ -1,10 +1,12 @@
 /**
- * Simple WebSocket helper for Finnhub live market data
- * Rate limited to 10 seconds per symbol
+ * WebSocket helper for live market data
+ * Connects to the backend price hub (/ws/prices), which holds a single
+ * upstream Finnhub connection and conflates ticks per symbol server-side.
  */
+const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+
 class FinnhubSocket {
-  constructor({ apiKey, symbols, onTrade }) {
-    this.apiKey = apiKey;
+  constructor({ symbols, onTrade, interval = 10 }) {
     this.symbols = symbols || [];
     this.onTrade = onTrade;
     this.socket = null;
@@ -12,9 +14,8 @@ class FinnhubSocket {
     this.isConnecting = false;
     this.shouldConnect = true;
     
-    // Rate limiting - only update UI every 10 seconds per symbol
-    this.lastUpdate = {};
-    this.RATE_LIMIT = 10000; // 10 seconds
+    // Server-side conflation - at most one update per symbol every `interval` seconds
+    this.interval = interval;
   }
 
   start() {
@@ -25,41 +26,28 @@ class FinnhubSocket {
     this.shouldConnect = true;
     this.isConnecting = true;
     
-    this.socket = new WebSocket(`wss://ws.finnhub.io?token=${this.apiKey}`);
+    const wsUrl = API_BASE_URL.replace(/^http/, 'ws');
+    const token = encodeURIComponent(localStorage.getItem('token') || '');
+    this.socket = new WebSocket(`${wsUrl}/ws/prices?token=${token}&interval=${this.interval}`);
     
     this.socket.onopen = () => {
       this.isConnecting = false;
-      console.log('✅ Finnhub connected');
-      this.symbols.forEach(symbol => {
-        if (this.socket?.readyState === WebSocket.OPEN) {
-          this.socket.send(JSON.stringify({ type: 'subscribe', symbol }));
-        }
-      });
+      console.log('✅ Price stream connected');
+      this.send({ type: 'subscribe', symbols: this.symbols });
     };
     
     this.socket.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
         
-        if (data.type === 'ping') {
-          this.socket?.send(JSON.stringify({ type: 'pong' }));
-        }
-        
-        if (data.type === 'trade' && data.data) {
+        if (data.type === 'trades' && data.data) {
           data.data.forEach(trade => {
-            const now = Date.now();
-            const lastTime = this.lastUpdate[trade.s] || 0;
-            
-            // Only update UI every 10 seconds per symbol
-            if (now - lastTime >= this.RATE_LIMIT) {
-              this.lastUpdate[trade.s] = now;
-              this.onTrade({
-                symbol: trade.s,
-                price: trade.p,
-                ts: trade.t,
-                size: trade.v
-              });
-            }
+            this.onTrade({
+              symbol: trade.symbol,
+              price: trade.price,
+              ts: trade.ts,
+              size: trade.size
+            });
           });
         }
       } catch (error) {
@@ -85,6 +73,14 @@ class FinnhubSocket {
     };
   }
 
+  send(message) {
+    if (this.socket?.readyState === WebSocket.OPEN) {
+      this.socket.send(JSON.stringify(message));
+      return true;
+    }
+    return false;
+  }
+
   stop() {
     this.shouldConnect = false;
     this.isConnecting = false;
@@ -98,24 +94,19 @@ class FinnhubSocket {
       this.socket.close(1000);
       this.socket = null;
     }
-    
-    this.lastUpdate = {};
   }
 
   updateSymbols(newSymbols) {
+    const removed = this.symbols.filter(symbol => !newSymbols.includes(symbol));
     this.symbols = newSymbols;
-    this.lastUpdate = {}; // Reset rate limiting for new symbols
     
     console.log(`🔄 Updating symbols: ${newSymbols.join(', ')}`);
     
-    if (this.socket?.readyState === WebSocket.OPEN) {
-      newSymbols.forEach(symbol => {
-        this.socket.send(JSON.stringify({ type: 'subscribe', symbol }));
-        console.log(`📊 Subscribed to ${symbol}`);
-      });
-    } else {
-      console.warn('❌ Cannot subscribe - WebSocket not connected');
+    // Not connected yet: symbols are subscribed on open
+    if (removed.length > 0) {
+      this.send({ type: 'unsubscribe', symbols: removed });
     }
+    this.send({ type: 'subscribe', symbols: newSymbols });
   }
 }
 
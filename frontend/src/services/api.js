@@ -24,9 +24,16 @@ export const stockAPI = {
   getStockData: (ticker, startDate, endDate) =>
     api.get(`/api/stocks/data/${ticker}?start_date=${startDate}&end_date=${endDate}`),
   
+  getIntradayBars: (ticker, interval = '1m', limit) =>
+    api.get(`/api/stocks/intraday/${ticker}`, { params: { interval, limit } }),
+  
   getStockInfo: (ticker) =>
     api.get(`/api/stocks/info/${ticker}`),
   
+  // Batch quotes (columnar response, see utils/quotes.js)
+  getQuotes: (symbols, wait = 5) =>
+    api.get('/api/stocks/quotes', { params: { symbols: symbols.join(','), wait } }),
+  
   // News and sentiment
   getStockNews: (ticker) =>
     api.get(`/api/stocks/news/${ticker}`),
@@ -93,8 +100,9 @@ export const portfolioAPI = {
       commission
     }),
   
-  getTradeHistory: () =>
-    api.get('/api/portfolio/trades'),
+  // params: { symbol, side, start_date, end_date, sector, cursor, limit, order }
+  getTradeHistory: (params = {}) =>
+    api.get('/api/portfolio/trades', { params }),
   
   getPnLBreakdown: () =>
     api.get('/api/portfolio/trades/pnl-breakdown'),
@@ -104,6 +112,18 @@ export const portfolioAPI = {
       responseType: 'blob'
     }),
   
+  importTrades: (file, lotMethod = 'FIFO') => {
+    const formData = new FormData();
+    formData.append('file', file);
+    return api.post('/api/portfolio/trades/import', formData, {
+      params: { lot_method: lotMethod },
+      headers: { 'Content-Type': 'multipart/form-data' }
+    });
+  },
+  
+  getValuation: () =>
+    api.get('/api/portfolio/valuation'),
+  
   getLivePrice: (ticker) =>
     api.get(`/api/portfolio/live-price/${ticker}`),
   
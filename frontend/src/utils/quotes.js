@@ -0,0 +1,15 @@
+/**
+ * Helpers for the columnar batch quotes response
+ */
+export const quotesToMap = (quotes) => {
+  const map = {};
+  const columns = quotes?.columns || {};
+  (quotes?.symbols || []).forEach((symbol, i) => {
+    const row = { ticker: symbol };
+    Object.keys(columns).forEach((field) => {
+      row[field] = columns[field][i];
+    });
+    map[symbol] = row;
+  });
+  return map;
+};